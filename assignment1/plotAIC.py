@@ -1,3 +1,5 @@
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -13,27 +15,20 @@ def plot_AIC():
     # Define a custom color palette
     custom_palette = sns.color_palette("husl", df['Alpha'].nunique())
     
-    # Get unique files
-    unique_files = df['File'].unique()
+    # One facet per file, all drawn from the same DataFrame in a single pass
+    g = sns.relplot(data=df, x='k', y='AIC', hue='Alpha', style='Alpha', kind='line', col='File', col_wrap=3,
+                    markers=True, dashes=False, palette=custom_palette, markersize=8,
+                    height=4, aspect=1.5, facet_kws={'sharey': False})
     
-    for file in unique_files:
-        # Filter data for the current file
-        df_file = df[df['File'] == file]
-        
-        # Create plots
-        plt.figure(figsize=(12, 6))
-        sns.lineplot(data=df_file, x='k', y='AIC', hue='Alpha', style='Alpha', markers=True, dashes=False, palette=custom_palette, markersize=8)
-        
-        # Customize plot
-        plt.xlabel("Markov Order (k)")
-        plt.ylabel("Average Information Content")
-        plt.title(f"Average Information Content - {file}")
-        plt.legend(title="Alpha")
-        plt.grid(True)
-        
-        # Save and show plot
-        plt.savefig(f"graphics/plots_aic/aic_plot_{file}.png")
-        plt.show()
+    # Customize plot
+    g.set_axis_labels("Markov Order (k)", "Average Information Content")
+    g.set_titles("Average Information Content - {col_name}")
+    for ax in g.axes.flat:
+        ax.grid(True)
+    
+    # Save plot
+    g.savefig("graphics/plots_aic/aic_plots_all.png")
+    plt.close(g.figure)
 
 if __name__ == "__main__":
     plot_AIC()
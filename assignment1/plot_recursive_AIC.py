@@ -1,3 +1,6 @@
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -6,48 +9,43 @@ import os
 # Create directory if it doesn't exist
 os.makedirs("graphics/plots_recursive", exist_ok=True)
 
+# Set the style for seaborn once for every plot
+sns.set_style("whitegrid")
+plt.rcParams.update({'font.family': 'DejaVu Sans', 'svg.fonttype': 'none'})
+
 def plot_AIC_recursive():
-    # Load the CSV file
-    df = pd.read_csv("aic_results_recursive.csv")
+    # Load the CSV file, parsing every column straight into its final type
+    df = pd.read_csv("aic_results_recursive.csv",
+                     dtype={'Iteration': np.int32, 'File': 'string', 'k': np.int32, 'Alpha': np.float64,
+                            'Prior': 'string', 'Sequence_Length': np.int32,
+                            'AIC': np.float32, 'Entropy': np.float32})
+    
+    # Sort data for correct plotting (rows are already almost in order, which a stable sort handles cheaply)
+    df.sort_values(by=['File', 'Iteration'], inplace=True, kind='stable')
     
-    # Convert Iteration column to numeric for sorting
-    df['Iteration'] = df['Iteration'].astype(int)
+    # Prior and sequence length of each file (taken from its first row) for the facet titles
+    file_info = df.groupby('File', sort=False)[['Prior', 'Sequence_Length']].first()
     
-    # Sort data for correct plotting
-    df = df.sort_values(by=['File', 'Iteration'])
+    # Put AIC and Entropy in one column so both lines come from the same faceted plot
+    df_long = df.melt(id_vars=['File', 'Iteration'], value_vars=['AIC', 'Entropy'],
+                      var_name='Metric', value_name='Value')
     
-    # Set the style for seaborn
-    sns.set_style("whitegrid")
+    # Plot AIC and Entropy for every file, one facet per file
+    g = sns.relplot(data=df_long, x='Iteration', y='Value', hue='Metric', style='Metric', kind='line',
+                    col='File', col_wrap=3, markers={'AIC': 'o', 'Entropy': 's'}, dashes=False,
+                    palette={'AIC': 'blue', 'Entropy': 'red'}, height=4, aspect=1.5,
+                    facet_kws={'sharey': False})
     
-    # Get unique files for separate plots
-    unique_files = df['File'].unique()
+    # Customize plot
+    g.set_axis_labels("Iteration", "Value (bps)")
+    for file, ax in g.axes_dict.items():
+        prior, seq_length = file_info.loc[file]
+        ax.set_title(f"AIC and Entropy Evolution for {file}\nPrior: '{prior}', Sequence Length: {seq_length}")
+        ax.grid(True)
     
-    # Plot AIC and Entropy for each file
-    for file in unique_files:
-        df_file = df[df['File'] == file]
-        
-        # Get the prior and sequence length for this file
-        prior = df_file['Prior'].iloc[0]  # Get prior from the first row
-        seq_length = df_file['Sequence_Length'].iloc[0]  # Get sequence length from the first row
-        
-        plt.figure(figsize=(12, 6))
-        
-        # Plot AIC
-        sns.lineplot(data=df_file, x='Iteration', y='AIC', marker="o", label="AIC", color="blue")
-        
-        # Plot Entropy on the same graph
-        sns.lineplot(data=df_file, x='Iteration', y='Entropy', marker="s", label="Entropy", color="red")
-        
-        # Customize plot
-        plt.xlabel("Iteration")
-        plt.ylabel("Value (bps)")
-        plt.title(f"AIC and Entropy Evolution for {file}\nPrior: '{prior}', Sequence Length: {seq_length}")
-        plt.legend()
-        plt.grid(True)
-        
-        # Save each plot as an image
-        plt.savefig(f"graphics/plots_recursive/aic_entropy_evolution_{file}.png")
-        plt.show()
+    # Save all facets as one image
+    g.savefig("graphics/plots_recursive/aic_entropy_evolution_all.png")
+    plt.close(g.figure)
 
 if __name__ == "__main__":
     plot_AIC_recursive()
\ No newline at end of file
@@ -203,12 +203,51 @@ void save_results_to_csv(const std::vector<OrganismMatch>& results, int top) {
     std::cout << "Results saved to results.csv" << std::endl;
 }
 
+// Classify every sample of a multi-sample file (database format) in a single run,
+// so the reference database is read only once
+int run_batch(const std::string& db_file, const std::string& batch_file, int k, double alpha, int top) {
+    std::cout << "Reading samples from " << batch_file << "..." << std::endl;
+    auto samples = read_reference_database(batch_file);
+    std::cout << "Batch contains " << samples.size() << " samples." << std::endl;
+
+    std::cout << "Reading reference database from " << db_file << "..." << std::endl;
+    auto reference_db = read_reference_database(db_file);
+    std::cout << "Database contains " << reference_db.size() << " reference sequences." << std::endl;
+
+    std::ofstream outFile("results_batch.tsv");
+    if (!outFile.is_open()) {
+        std::cerr << "Error: Could not open results_batch.tsv for writing." << std::endl;
+        return 1;
+    }
+
+    outFile << "Query\tRank\tNRC\tOrganism\n";
+    for (size_t s = 0; s < samples.size(); ++s) {
+        std::cout << "Processing " << s + 1 << "/" << samples.size() << ": " << samples[s].first << std::endl;
+
+        MarkovModel model(k, alpha);
+        model.train(samples[s].second);
+
+        auto results = calculate_nrc_parallel(reference_db, model);
+        std::sort(results.begin(), results.end());
+
+        int limit = std::min(top, static_cast<int>(results.size()));
+        for (int i = 0; i < limit; ++i) {
+            outFile << samples[s].first << "\t" << i + 1 << "\t" << results[i].nrc << "\t" << results[i].name << "\n";
+        }
+    }
+
+    outFile.close();
+    std::cout << "Results saved to results_batch.tsv" << std::endl;
+    return 0;
+}
+
 void display_help() {
     std::cout << "MetaClass: Metagenome classification using NRC\n\n";
-    std::cout << "Usage: MetaClass -d <database> -s <sample> [-k <context>] [-a <alpha>] [-t <top>]\n\n";
+    std::cout << "Usage: MetaClass -d <database> (-s <sample> | -m <samples>) [-k <context>] [-a <alpha>] [-t <top>]\n\n";
     std::cout << "Options:\n";
     std::cout << "  -d FILE   Path to the reference database file\n";
     std::cout << "  -s FILE   Path to the metagenomic sample file\n";
+    std::cout << "  -m FILE   Path to a multi-sample file in database format (batch mode)\n";
     std::cout << "  -k INT    Context size for Markov model (default: 10)\n";
     std::cout << "  -a FLOAT  Smoothing parameter (default: 0.1)\n";
     std::cout << "  -t INT    Number of top matches to display (default: 20)\n";
@@ -218,6 +257,7 @@ void display_help() {
 int main(int argc, char* argv[]) {
     std::string db_file;
     std::string sample_file;
+    std::string batch_file;
     int k = 10;
     double alpha = 0.1;
     int top = 20;
@@ -232,6 +272,8 @@ int main(int argc, char* argv[]) {
             db_file = argv[++i];
         } else if (arg == "-s" && i + 1 < argc) {
             sample_file = argv[++i];
+        } else if (arg == "-m" && i + 1 < argc) {
+            batch_file = argv[++i];
         } else if (arg == "-k" && i + 1 < argc) {
             k = std::stoi(argv[++i]);
         } else if (arg == "-a" && i + 1 < argc) {
@@ -245,11 +287,15 @@ int main(int argc, char* argv[]) {
         }
     }
     
-    if (db_file.empty() || sample_file.empty()) {
+    if (db_file.empty() || (sample_file.empty() && batch_file.empty())) {
         std::cerr << "Error: Database and sample files are required.\n";
         display_help();
         return 1;
     }
+
+    if (!batch_file.empty()) {
+        return run_batch(db_file, batch_file, k, alpha, top);
+    }
     
     // Read the metagenomic sample
     std::cout << "Reading metagenomic sample from " << sample_file << "..." << std::endl;
@@ -1,30 +1,18 @@
-import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import re
 import os
+import argparse
 from matplotlib.ticker import MaxNLocator
+from numpy.lib.stride_tricks import sliding_window_view
 
-sns.set_style("whitegrid")
-plt.rcParams.update({'font.size': 10})
-
-if not os.path.exists('plots'):
-    os.makedirs('plots')
-
-with open('results.csv') as f:
-    lines = f.readlines()
-
-data = []
-for line in lines[1:]:
-    parts = line.strip().split(',', 2)
-    if len(parts) == 3:
-        rank, nrc, organism = parts
-        data.append({'Rank': int(rank), 'NRC': float(nrc), 'Organism': organism})
+from results_loader import load_results
 
-df = pd.DataFrame(data)
-
-df['Similarity'] = 1 - df['NRC']
+sns.set_style("whitegrid")
+plt.rcParams.update({'font.size': 10, 'font.family': 'DejaVu Sans', 'svg.fonttype': 'none'})
 
 def find_stabilization_point(values, window=3, threshold=0.03):
     """
@@ -38,45 +26,56 @@ def find_stabilization_point(values, window=3, threshold=0.03):
     diffs = np.abs(np.diff(values))
     
     # Find where differences become small consistently
-    for i in range(len(diffs) - window + 1):
-        if all(diff < threshold for diff in diffs[i:i+window]):
-            return i + 1  # +1 because diff array is 1 shorter than values
+    stable = sliding_window_view(diffs < threshold, window).all(axis=1)
+    idx = int(np.argmax(stable))
+    if stable[idx]:
+        return idx + 1  # +1 because diff array is 1 shorter than values
     
     return len(values)  # If no stabilization point found
 
-def shorten_organism_name(name, max_length=15):
-    # Remove reference IDs and keep main organism name
-    short_name = re.sub(r'^([^|]*\|){0,4}', '', name)
-    # Remove common prefixes
-    short_name = re.sub(r'^(NC_|gi\||ref\|)', '', short_name)
+_STRIP_PIPES = re.compile(r'^([^|]*\|){0,4}')
+_STRIP_PREFIX = re.compile(r'^(NC_|gi\||ref\|)')
+_LAST_PIPE = re.compile(r'^.*\|')
+
+def shorten_organism_names(names, max_length=15):
+    # Remove reference IDs and common prefixes, keeping the main organism name
+    short_names = names.str.replace(_STRIP_PIPES, '', regex=True).str.replace(_STRIP_PREFIX, '', regex=True)
     # Get the first part if comma-separated
-    if ',' in short_name:
-        short_name = short_name.split(',')[0]
+    short_names = short_names.str.split(',', n=1).str[0]
     # Further shorten if still too long
-    if len(short_name) > max_length:
-        short_name = short_name[:max_length] + '...'
-    return short_name
+    return short_names.where(short_names.str.len() <= max_length, short_names.str[:max_length] + '...')
 
-df['ShortName'] = df['Organism'].apply(shorten_organism_name)
+_df = None
 
-# Calculate threshold between rank 5 and 6
-threshold = (df.iloc[4]['NRC'] + df.iloc[5]['NRC']) / 2
+def get_results():
+    """Parse results.csv once per run and add the derived plotting columns"""
+    global _df
+    if _df is None:
+        df = load_results('results.csv', cache=True)
+        df['Similarity'] = 1 - df['NRC']
+        df['ShortName'] = shorten_organism_names(df['Organism'])
+        _df = df
+    return _df
 
-def create_nrc_visualization():
+def create_nrc_visualization(df):
     """Create visualization of NRC values with stabilization point and all organism names"""
     # Find cutoff point based on where 1-NRC values stabilize
-    cutoff_idx = find_stabilization_point(df['Similarity'].values)
+    sim = df['Similarity'].to_numpy()
+    cutoff_idx = find_stabilization_point(sim)
     print(f"Stabilization detected at index {cutoff_idx} (Organism: {df['Organism'][cutoff_idx-1]})")
 
+    idx = np.arange(len(df))
+    top_idx = idx[:cutoff_idx]
+
     plt.figure(figsize=(24, 10))
 
-    plt.plot(range(len(df)), df['Similarity'], 'o-', color='blue', markersize=5)
+    plt.plot(idx, sim, 'o-', color='blue', markersize=5, rasterized=True)
 
-    plt.plot(range(cutoff_idx), df['Similarity'][:cutoff_idx], 'o-', color='red', markersize=8)
+    plt.plot(top_idx, sim[:cutoff_idx], 'o-', color='red', markersize=8, rasterized=True)
 
     plt.axvline(x=cutoff_idx-0.5, color='green', linestyle='--', label=f'Stabilization point: {cutoff_idx}')
 
-    plt.fill_between(range(cutoff_idx), 0, df['Similarity'][:cutoff_idx], alpha=0.3, color='green')
+    plt.fill_between(top_idx, 0, sim[:cutoff_idx], alpha=0.3, color='green', rasterized=True)
 
     plt.xlabel('Organisms (ranked by NRC)', fontsize=14)
     plt.ylabel('Similarity (1-NRC)', fontsize=14)
@@ -84,10 +83,9 @@ def create_nrc_visualization():
 
     ax = plt.gca()
 
-    ax.set_xticks(range(len(df)))
-    ax.set_xticklabels(df['ShortName'], rotation=90, ha='center', fontsize=9)
-
-    ax.xaxis.set_major_locator(plt.FixedLocator(range(len(df))))
+    # set_xticks already installs a FixedLocator for these positions
+    ax.set_xticks(idx)
+    ax.set_xticklabels(df['ShortName'].to_numpy(), rotation=90, ha='center', fontsize=9)
 
     plt.grid(True, linestyle='--', alpha=0.7)
 
@@ -95,7 +93,7 @@ def create_nrc_visualization():
 
     plt.subplots_adjust(bottom=0.3)
 
-    plt.savefig('plots/nrc_visualization.png', dpi=300)
+    plt.savefig('plots/nrc_visualization.png', dpi=300, bbox_inches='tight')
     plt.close()
 
     print("\nDetailed analysis:")
@@ -103,18 +101,22 @@ def create_nrc_visualization():
     print(f"Number of organisms before stabilization: {cutoff_idx}")
     print("\nTop organisms by similarity:")
     for i in range(min(cutoff_idx, len(df))):
-        print(f"{i+1}. {df['Organism'][i]} (NRC: {df['NRC'][i]:.4f}, Similarity: {df['Similarity'][i]:.4f})")
+        print(f"{i+1}. {df['Organism'][i]} (NRC: {df['NRC'][i]:.4f}, Similarity: {sim[i]:.4f})")
 
 
-def create_complexity_profile():
+def create_complexity_profile(df):
     """Create complexity profile visualization as in the original code"""
+    rng = np.random.default_rng(seed=42)
+
     def simulate_complexity_profile(sequence_length, complexity_level, noise_level=0.1):
         base = np.ones(sequence_length) * complexity_level
-        noise = np.random.normal(0, noise_level, sequence_length)
+        noise = rng.normal(0, noise_level, sequence_length)
         return base + noise
 
     def moving_average(data, window_size):
-        return np.convolve(data, np.ones(window_size) / window_size, mode='valid')
+        # Running sum: O(N) regardless of the window width
+        c = np.cumsum(np.insert(data, 0, 0.0))
+        return (c[window_size:] - c[:-window_size]) / window_size
 
     top_matches = df.head(5)  # Get top 5 matches
     seq_length = 20000  # Example length
@@ -130,20 +132,24 @@ def create_complexity_profile():
 
     colors = ['b', 'g', 'r', 'c', 'm']
 
-    for i, (_, row) in enumerate(top_matches.iterrows()):
+    ranks = top_matches['Rank'].to_numpy()
+    nrcs = top_matches['NRC'].to_numpy()
+    organisms = top_matches['Organism'].to_numpy()
+
+    for i in range(len(top_matches)):
         match_profile = simulate_complexity_profile(
             len(positions) + window_size - 1, 
-            1.0 + (row['NRC'] * 0.5), 
+            1.0 + (nrcs[i] * 0.5), 
             0.15
         )
         smoothed_match_profile = moving_average(match_profile, window_size) 
 
-        short_name = re.sub(r'^.*\|', '', row['Organism'])
+        short_name = _LAST_PIPE.sub('', organisms[i])
         short_name = short_name[:30] + '...' if len(short_name) > 30 else short_name
 
         plt.plot(positions, smoothed_match_profile, 
                  color=colors[i], 
-                 label=f"{row['Rank']}. {short_name} (NRC: {row['NRC']:.3f})")
+                 label=f"{ranks[i]}. {short_name} (NRC: {nrcs[i]:.3f})")
 
     plt.xlabel('Sequence Position (sliding window)', fontsize=12)
     plt.ylabel('Estimated Bits per Symbol (Local Complexity)', fontsize=12)
@@ -155,14 +161,28 @@ def create_complexity_profile():
     plt.savefig('plots/complexity_profile.png', dpi=300)
     plt.close()
 
-def generate_all_visualizations():
-    print("Creating NRC visualization with all organism names...")
-    create_nrc_visualization()
+def generate_all_visualizations(plot='all'):
+    if not os.path.exists('plots'):
+        os.makedirs('plots')
+
+    df = get_results()
+
+    if plot in ('nrc', 'all'):
+        print("Creating NRC visualization with all organism names...")
+        create_nrc_visualization(df)
     
-    print("Creating complexity profile...")
-    create_complexity_profile()
+    if plot in ('complexity', 'all'):
+        print("Creating complexity profile...")
+        create_complexity_profile(df)
     
     print("Done! All visualizations saved in the 'plots' directory.")
 
+def main():
+    parser = argparse.ArgumentParser(description='Generate visualizations from MetaClass results.csv')
+    parser.add_argument('--plot', choices=['nrc', 'complexity', 'all'], default='all',
+                        help='Which visualization to generate')
+    args = parser.parse_args()
+    generate_all_visualizations(args.plot)
+
 if __name__ == "__main__":
-    generate_all_visualizations()
\ No newline at end of file
+    main()
@@ -1,3 +1,5 @@
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -6,60 +8,75 @@ import os
 import pandas as pd
 import numpy as np
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import imshow_heatmap
+
+imshow_heatmap.apply_patch()
 
 # Define parameter ranges
 k_values = [4, 6, 8, 10, 12, 14]
 a_values = [0.001, 0.01, 0.05, 0.1, 0.2]
 
-results_matrix = []
-
 # Output directory for each run
 if not os.path.exists("runs"):
     os.makedirs("runs")
 
+# MetaClass already spreads each run over all cores, so only overlap a few runs
+max_workers = max(1, (os.cpu_count() or 1) // 4)
+
 def run_metaclass(k, a):
     output_file = f"runs/output_k{k}_a{a}.txt"
     command = f"./MetaClass -d db.txt -s meta.txt -k {k} -a {a} -t 20"
     
+    # Every run writes its own results.csv, so give each one a private working directory
+    run_dir = f"runs/k{k}_a{a}"
+    os.makedirs(run_dir, exist_ok=True)
+    args = [os.path.abspath("MetaClass"), "-d", os.path.abspath("db.txt"), "-s", os.path.abspath("meta.txt"),
+            "-k", str(k), "-a", str(a), "-t", "20"]
+    
     print(f"Running: {command}")
-    result = subprocess.run(command.split(), capture_output=True, text=True)
+    # Parse stdout as MetaClass writes it; the per-run log is only a copy of the stream
+    with open(output_file, 'w') as log, \
+            subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             text=True, cwd=run_dir) as proc:
+        avg_nrc = parse_output_for_average(tee(proc.stdout, log))
 
-    with open(output_file, 'w') as f:
-        f.write(result.stdout)
+    return avg_nrc
 
-    return output_file
+def tee(lines, log):
+    for line in lines:
+        log.write(line)
+        yield line
 
-def parse_output_for_average(file_path):
-    nrc_values = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            match = re.search(r'([0-9]+\.[0-9]+)', line)
-            if match:
-                try:
-                    value = float(match.group(1))
-                    nrc_values.append(value)
-                except:
-                    pass
-    if nrc_values:
-        return round(sum(nrc_values) / len(nrc_values), 4)
+# Only the ranked "Rank  NRC  Organism" rows; stdout also echoes timings, alpha and file paths
+nrc_pattern = re.compile(r'^\s*\d+\s+([0-9]+\.[0-9]+)\s')
+
+def parse_output_for_average(lines):
+    matches = (nrc_pattern.match(line) for line in lines)
+    nrc_values = np.fromiter((float(m.group(1)) for m in matches if m), dtype=np.float64)
+    if nrc_values.size:
+        return round(float(nrc_values.mean()), 4)
     else:
         return None
 
-for k in k_values:
-    row = []
-    for a in a_values:
-        output = run_metaclass(k, a)
-        avg_nrc = parse_output_for_average(output)
-        row.append(avg_nrc if avg_nrc is not None else np.nan)
-    results_matrix.append(row)
+jobs = [(k, a) for k in k_values for a in a_values]
+averages = {}
+with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {executor.submit(run_metaclass, k, a): (k, a) for k, a in jobs}
+    for future in as_completed(futures):
+        averages[futures[future]] = future.result()
+
+results_matrix = np.full((len(k_values), len(a_values)), np.nan)
+for (k, a), avg_nrc in averages.items():
+    if avg_nrc is not None:
+        results_matrix[k_values.index(k), a_values.index(a)] = avg_nrc
 
 df = pd.DataFrame(results_matrix, index=[f'k={k}' for k in k_values], columns=[f'a={a}' for a in a_values])
 df.to_csv("nrc_heatmap_matrix.csv")
 print("\nGrid results saved to nrc_heatmap_matrix.csv")
 
-
-df = pd.read_csv('nrc_heatmap_matrix.csv', index_col=0)
-
+# The CSV is only an artifact; plot the in-memory matrix rather than reading it back
 plt.figure(figsize=(10, 6))
 sns.heatmap(df, annot=True, cmap='YlGnBu', fmt=".3f", linewidths=0.5, cbar_kws={'label': 'Average NRC'})
 plt.title('Average NRC Heatmap for Top 20 Matches')
@@ -67,4 +84,4 @@ plt.xlabel('Alpha (-a)')
 plt.ylabel('Context Length (-k)')
 plt.tight_layout()
 plt.savefig('plots/nrc_param_heatmap.png', dpi=300)
-plt.show()
\ No newline at end of file
+plt.close()
\ No newline at end of file
@@ -1,9 +1,16 @@
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+import imshow_heatmap
+from results_loader import load_results
+
+imshow_heatmap.apply_patch()
+
 def get_group(name):
     """
     Extract a simple group name from the Organism string.
@@ -25,48 +32,41 @@ def shorten_name(name, max_length=20):
     name = str(name)
     return name if len(name) <= max_length else name[:max_length] + "..."
 
-with open('results.csv') as f:
-    lines = f.readlines()
-
-data = []
-for line in lines[1:]: 
-    parts = line.strip().split(',', 2)
-    if len(parts) == 3:
-        rank, nrc, organism = parts
-        data.append({'Rank': int(rank), 'NRC': float(nrc), 'Organism': organism})
-        
-results = pd.DataFrame(data)
+results = load_results('results.csv', cache=True)
 print(results['NRC'])
 
 results['group'] = results['Organism'].apply(get_group)
 
 group_counts = results['group'].value_counts()
-similar_groups = group_counts[group_counts > 1].index.tolist()
+similar_groups = group_counts[group_counts > 1].index
 
 output_dir = 'plots/similarity_heatmaps'
 os.makedirs(output_dir, exist_ok=True)
 
-for grp in similar_groups:
-    grp_data = results[results['group'] == grp].reset_index(drop=True)
-    n = len(grp_data)
-    
+# One figure for every group; it is cleared between heatmaps instead of re-created
+fig = plt.figure(figsize=(10, 8))
+
+# Split the rows into groups in a single pass rather than masking the whole table per group
+for grp, grp_data in results[results['group'].isin(similar_groups)].groupby('group', sort=False):
+    grp_data = grp_data.reset_index(drop=True)
+
     # Create matrix of absolute differences in NRC values
-    matrix = np.zeros((n, n))
-    for i in range(n):
-        for j in range(n):
-            matrix[i, j] = abs(grp_data.loc[i, 'NRC'] - grp_data.loc[j, 'NRC'])
-    
+    v = grp_data['NRC'].to_numpy(dtype=np.float64)
+    matrix = np.abs(np.subtract.outer(v, v))
+
     short_names = grp_data['Organism'].apply(lambda n: shorten_name(n, max_length=20))
     df_matrix = pd.DataFrame(matrix, index=short_names, columns=short_names)
     
-    plt.figure(figsize=(10, 8))
+    fig.clf()
+    ax = fig.add_subplot()
     sns.heatmap(df_matrix, annot=True, cmap='YlGnBu', fmt=".3f", linewidths=0.5,
-                cbar_kws={'label': 'NRC Difference'})
-    plt.title(f'Similarity Heatmap for Group: {grp}')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
+                cbar_kws={'label': 'NRC Difference'}, ax=ax)
+    ax.set_title(f'Similarity Heatmap for Group: {grp}')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
     
     filename = os.path.join(output_dir, f"{grp.replace(' ', '_')}_similarity_heatmap.png")
-    plt.savefig(filename, dpi=300)
-    plt.close()
-    print(f"Saved heatmap for group '{grp}' to {filename}")
\ No newline at end of file
+    fig.savefig(filename, dpi=300)
+    print(f"Saved heatmap for group '{grp}' to {filename}")
+
+plt.close(fig)
\ No newline at end of file
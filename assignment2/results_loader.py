@@ -0,0 +1,46 @@
+import csv
+import os
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Rank', 'NRC', 'Organism']
+DTYPES = {'Rank': np.int32, 'NRC': np.float64, 'Organism': 'string'}
+
+
+def _parse_results_csv(csv_path):
+    """
+    MetaClass writes the organism name unquoted and it often contains commas,
+    so every line is read by the C parser as a single field and then split on
+    its first two commas only.
+    """
+    lines = pd.read_csv(csv_path, sep='\x1f', header=0, names=['line'], dtype='string',
+                        quoting=csv.QUOTE_NONE, engine='c')
+    parts = lines['line'].str.split(',', n=2, expand=True).reindex(columns=range(3)).dropna()
+    parts.columns = COLUMNS
+    return parts.astype(DTYPES).reset_index(drop=True)
+
+
+def load_results(csv_path='results.csv', cache=False):
+    """
+    Load the results.csv written by MetaClass into a DataFrame.
+    With cache=True the parsed table is kept in a Parquet file next to the CSV
+    and reused for as long as it is newer than the CSV (needs pyarrow).
+    """
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+
+    if cache and os.path.exists(parquet_path) and \
+            os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(parquet_path)
+        except ImportError:
+            pass
+
+    df = _parse_results_csv(csv_path)
+
+    if cache:
+        try:
+            df.to_parquet(parquet_path, index=False)
+        except ImportError:
+            pass
+
+    return df
@@ -1,25 +1,60 @@
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import subprocess
 import os
+import sys
 import re
+import csv
+import mmap
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+import imshow_heatmap
+from results_loader import load_results
+
+imshow_heatmap.apply_patch()
+
+_STRIP_PIPES = re.compile(r'^([^|]*\|){0,4}')
+_STRIP_PREFIX = re.compile(r'^(NC_|gi\||ref\|)')
+
+@lru_cache(maxsize=None)
+def index_db(db_file):
+    """Memory-map the database file once and index each '@name' record to the byte span of its sequence."""
+    index = {}
+    if os.path.getsize(db_file) == 0:
+        return None, index
+    
+    with open(db_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    starts = [0] if mm[:1] == b'@' else []
+    pos = mm.find(b'\n@')
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = mm.find(b'\n@', pos + 1)
+    
+    for i, start in enumerate(starts):
+        header_end = mm.find(b'\n', start)
+        if header_end == -1:
+            header_end = len(mm)
+        end = starts[i + 1] if i + 1 < len(starts) else len(mm)
+        name = mm[start + 1:header_end].decode().strip()
+        index.setdefault(name, (header_end + 1, end))
+    
+    return mm, index
 
 def extract_sequence_from_db(db_file, organism_name):
     """Extract the DNA sequence for a specific organism from the database file."""
-    with open(db_file, 'r') as f:
-        content = f.read()
-    
-    # Find the section for the organism
-    pattern = f"@{re.escape(organism_name)}\\n([ACGT\\n]+?)(?=@|$)"
-    match = re.search(pattern, content, re.DOTALL)
-    
-    if match:
-        # Get the sequence and remove any whitespace
-        sequence = match.group(1)
-        sequence = re.sub(r'\s+', '', sequence)
-        return sequence
+    mm, index = index_db(db_file)
+    
+    if organism_name in index:
+        # Slice the mapped file and remove any whitespace
+        start, end = index[organism_name]
+        return b''.join(mm[start:end].split()).decode()
     else:
         print(f"Warning: Could not find organism '{organism_name}' in the database.")
         return None
@@ -33,17 +68,7 @@ def find_stabilization_organisms():
         print(f"Error running MetaClass: {e}")
         return []
 
-    with open('results.csv') as f:
-        lines = f.readlines()
-
-    data = []
-    for line in lines[1:]:
-        parts = line.strip().split(',', 2)
-        if len(parts) == 3:
-            rank, nrc, organism = parts
-            data.append({'Rank': int(rank), 'NRC': float(nrc), 'Organism': organism})
-
-    df = pd.DataFrame(data)
+    df = load_results('results.csv')
     
     # Calculate 1-NRC for each organism (higher means more similar)
     df['Similarity'] = 1 - df['NRC']
@@ -55,9 +80,10 @@ def find_stabilization_organisms():
         
         diffs = np.abs(np.diff(values))
         
-        for i in range(len(diffs) - window + 1):
-            if all(diff < threshold for diff in diffs[i:i+window]):
-                return i + 1
+        stable = sliding_window_view(diffs < threshold, window).all(axis=1)
+        idx = int(np.argmax(stable))
+        if stable[idx]:
+            return idx + 1
         
         return len(values)
     
@@ -72,43 +98,38 @@ def create_similarity_matrix(db_file, organisms, output_dir="./"):
     os.makedirs("temp_meta", exist_ok=True)
     
     n_organisms = len(organisms)
-    similarity_matrix = np.zeros((n_organisms, n_organisms))
+    
+    # Write every query into one multi-sample file so MetaClass runs only once
+    queried = []
+    with open("temp_meta/queries.txt", "w") as f:
+        for query_organism in organisms:
+            sequence = extract_sequence_from_db(db_file, query_organism)
+            if sequence is None:
+                continue
+            f.write(f"@{query_organism}\n{sequence}\n")
+            queried.append(query_organism)
+    
+    cmd = ["./MetaClass", "-d", db_file, "-m", "temp_meta/queries.txt", "-k", "10", "-a", "0.01", "-t", "20"]
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error running MetaClass: {e}")
+        return None
+    
+    batch = pd.read_csv('results_batch.tsv', sep='\t', quoting=csv.QUOTE_NONE,
+                        dtype={'Query': 'string', 'Rank': np.int32, 'NRC': np.float64, 'Organism': 'string'})
+    batch = batch.drop_duplicates(subset=['Query', 'Organism'], keep='last')
+    nrc = batch.pivot(index='Query', columns='Organism', values='NRC').reindex(index=organisms, columns=organisms)
+    nrc_values = nrc.to_numpy(dtype=np.float64)
     
     for i, query_organism in enumerate(organisms):
-        print(f"Processing {i+1}/{n_organisms}: {query_organism}")
-        
-        sequence = extract_sequence_from_db(db_file, query_organism)
-        if sequence is None:
-            continue
-            
-        with open("temp_meta/query.txt", "w") as f:
-            f.write(sequence)
-        
-        # Run MetaClass with this sequence as the query
-        cmd = ["./MetaClass", "-d", db_file, "-s", "temp_meta/query.txt", "-k", "10", "-a", "0.01", "-t", "20"]
-        try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error running MetaClass: {e}")
+        if query_organism not in queried:
             continue
-            
-        with open('results.csv') as f:
-            lines = f.readlines()[1:]  
-        
-        results = {}
-        for line in lines:
-            parts = line.strip().split(',', 2)
-            if len(parts) == 3:
-                rank, nrc, org = parts
-                results[org] = float(nrc)
-        
-        for j, ref_organism in enumerate(organisms):
-            if ref_organism in results:
-                similarity_matrix[i, j] = max(0, 1 - results[ref_organism])  # Ensure no negative values
-            else:
-                # If not found, use a default low similarity value
-                similarity_matrix[i, j] = 0.0
-                print(f"Warning: {ref_organism} not found in results for {query_organism}")
+        for j in np.flatnonzero(np.isnan(nrc_values[i])):
+            print(f"Warning: {organisms[j]} not found in results for {query_organism}")
+    
+    # Ensure no negative values; pairs not found get a default low similarity value
+    similarity_matrix = np.nan_to_num(np.maximum(0, 1 - nrc_values), nan=0.0)
     
     # Make sure diagonal is 1.0 (perfect similarity with self)
     for i in range(n_organisms):
@@ -117,8 +138,8 @@ def create_similarity_matrix(db_file, organisms, output_dir="./"):
     short_names = []
     for name in organisms:
         # Simplify names for better display
-        short_name = re.sub(r'^([^|]*\|){0,4}', '', name)
-        short_name = re.sub(r'^(NC_|gi\||ref\|)', '', short_name)
+        short_name = _STRIP_PIPES.sub('', name)
+        short_name = _STRIP_PREFIX.sub('', short_name)
         if ',' in short_name:
             short_name = short_name.split(',')[0]
         if len(short_name) > 15:
@@ -188,10 +209,15 @@ def main():
     
     # Create similarity matrix
     print("\nCreating similarity matrix...")
-    create_similarity_matrix(db_file, organisms, "plots")
+    similarity_matrix = create_similarity_matrix(db_file, organisms, "plots")
     
     cleanup()
     
+    # All queries go through one MetaClass run, so a failure leaves no partial matrix
+    if similarity_matrix is None:
+        print("Error: MetaClass failed; no similarity matrix was created.")
+        sys.exit(1)
+    
     print("\nDone! Similarity matrix has been created in the 'plots' directory.")
 
 if __name__ == "__main__":
@@ -8,6 +8,7 @@ import os
 import sys
 import argparse
 import random
+import itertools
 from pathlib import Path
 
 # Add src to path
@@ -62,20 +63,28 @@ def main():
     
     # Find audio files
     audio_extensions = ['.wav', '.flac', '.mp3']
-    audio_files = []
+    candidates = itertools.chain.from_iterable(
+        database_path.glob(f"*{ext}") for ext in audio_extensions
+    )
+    #candidates = itertools.chain.from_iterable(database_path.glob(f"**/*{ext}") for ext in audio_extensions)
     
-    for ext in audio_extensions:
-        audio_files.extend(list(database_path.glob(f"*{ext}")))
-        #audio_files.extend(list(database_path.glob(f"**/*{ext}")))
+    if args.max_songs:
+        # Reservoir sampling (Algorithm R): keep only max_songs paths in memory
+        audio_files = []
+        for i, audio_file in enumerate(candidates):
+            if i < args.max_songs:
+                audio_files.append(audio_file)
+            else:
+                j = random.randint(0, i)
+                if j < args.max_songs:
+                    audio_files[j] = audio_file
+    else:
+        audio_files = list(candidates)
     
     if not audio_files:
         print("No audio files found in database directory")
         return 1
     
-    # Limit number of songs if specified
-    if args.max_songs and len(audio_files) > args.max_songs:
-        audio_files = random.sample(audio_files, args.max_songs)
-    
     print(f"Processing {len(audio_files)} audio files")
     print(f"Generating {args.segments_per_song} segments per song")
     
@@ -7,11 +7,8 @@ Runs comprehensive music identification experiments.
 import os
 import sys
 import argparse
-import json
 from pathlib import Path
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -21,6 +18,12 @@ from music_identifier import MusicIdentifier
 
 def plot_results(df: pd.DataFrame, output_dir: str):
     """Generate plots for experimental results."""
+    # Imported here so runs without --generate-plots never load matplotlib/seaborn
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
@@ -135,7 +138,7 @@ def main():
                        help='Path to GetMaxFreqs executable')
     parser.add_argument('--compressors', nargs='+', 
                        default=['gzip', 'bzip2', 'lzma', 'zstd'],
-                       help='Compressors to test')
+                       help='Compressors to test (also deflate and lzma_fast; lz4 and igzip when the lz4 / isal packages are installed)')
     parser.add_argument('--noise-levels', nargs='+', type=float,
                        default=[0.0, 0.02, 0.05, 0.1],
                        help='Noise levels to test')
@@ -175,9 +178,10 @@ def main():
         print("Please run generate_queries.py first or place query files manually")
         return 1
     
-    query_files = []
-    for ext in ['.wav', '.flac']:
-        query_files.extend(list(queries_path.glob(f"*{ext}")))
+    # One pass over the (possibly large) queries directory
+    with os.scandir(queries_path) as entries:
+        query_files = [Path(entry.path) for entry in entries
+                       if entry.is_file() and entry.name.lower().endswith(('.wav', '.flac'))]
     
     if not query_files:
         print("No query files found")
@@ -5,15 +5,42 @@ Handles audio file manipulation, segment extraction, noise addition, and signatu
 """
 
 import os
+import shutil
 import subprocess
 import tempfile
 import random
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Tuple, Optional
 import librosa
 import soundfile as sf
 
+# Resolve sox on PATH once instead of on every subprocess call
+SOX = shutil.which('sox') or 'sox'
+
+# One PCG64 generator for all noise, instead of the legacy global RandomState
+_RNG = np.random.default_rng()
+
+
+@lru_cache(maxsize=8)
+def _decode_audio(path: str, mtime_ns: int, size: int, dtype: str) -> Tuple[np.ndarray, int]:
+    audio, sr = sf.read(path, dtype=dtype, always_2d=True)
+    # Shared between callers, so nobody may modify it in place
+    audio.flags.writeable = False
+    return audio, sr
+
+
+def _load_audio(path: str, dtype: str = 'float32') -> Tuple[np.ndarray, int]:
+    """
+    Decode a whole file as a read-only frames x channels array.
+    Recent decodes are reused for as long as the file is unchanged on disk,
+    e.g. a segment that gets several noise levels added to it.
+    """
+    st = os.stat(path)
+    return _decode_audio(os.fspath(path), st.st_mtime_ns, st.st_size, dtype)
+
 
 class AudioProcessor:
     """Handle audio file processing and manipulation."""
@@ -34,10 +61,46 @@ class AudioProcessor:
             else:
                 raise FileNotFoundError(f"GetMaxFreqs executable not found at {getmaxfreqs_path}")
     
+    def load_audio(self, audio_file: str, start_time: float = 0.0,
+                   duration: Optional[float] = None,
+                   dtype: str = 'float32') -> Tuple[np.ndarray, int]:
+        """
+        Read audio (or only part of it) into memory with soundfile.
+        
+        Args:
+            audio_file: Input audio file path
+            start_time: Start time in seconds
+            duration: Duration in seconds (None reads to the end)
+            dtype: Sample type of the returned array
+            
+        Returns:
+            (samples as a frames x channels array, sample rate)
+        """
+        with sf.SoundFile(audio_file) as f:
+            sr = f.samplerate
+            f.seek(int(round(start_time * sr)))
+            frames = -1 if duration is None else int(round(duration * sr))
+            audio = f.read(frames, dtype=dtype, always_2d=True)
+        return audio, sr
+    
+    def is_standard_wav(self, audio_file: str, sample_rate: int = 44100, channels: int = 2) -> bool:
+        """True if the file is already a WAV with this sample rate and channel count."""
+        if Path(audio_file).suffix.lower() != '.wav':
+            return False
+        try:
+            info = sf.info(str(audio_file))
+        except (RuntimeError, TypeError, ValueError):
+            return False
+        return info.format == 'WAV' and info.samplerate == sample_rate and info.channels == channels
+    
     def extract_segment(self, input_file: str, output_file: str, 
                        start_time: float, duration: float) -> bool:
         """
-        Extract a segment from audio file using sox.
+        Extract a segment from audio file.
+        
+        The segment is read and written in-process with soundfile (only the
+        requested frames are decoded); sox is used for formats soundfile
+        cannot read.
         
         Args:
             input_file: Input audio file path
@@ -48,12 +111,24 @@ class AudioProcessor:
         Returns:
             True if successful, False otherwise
         """
+        try:
+            audio, sr = self.load_audio(input_file, start_time, duration)
+            # Keep the source sample format when the container does not change
+            subtype = None
+            if Path(output_file).suffix.lower() == Path(input_file).suffix.lower():
+                subtype = sf.info(input_file).subtype
+            sf.write(output_file, audio, sr, subtype=subtype)
+            return True
+        except (RuntimeError, TypeError, ValueError):
+            pass
+        
         try:
             cmd = [
-                'sox', input_file, output_file,
+                SOX, input_file, output_file,
                 'trim', str(start_time), str(duration)
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # Only the exit status is used, so sox's output is not collected
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             return result.returncode == 0
         except Exception as e:
             print(f"Error extracting segment: {e}")
@@ -73,27 +148,21 @@ class AudioProcessor:
             True if successful, False otherwise
         """
         try:
-            # Load audio
-            audio, sr = librosa.load(input_file, sr=None, mono=False)
+            # Load audio as float32 in soundfile's native (frames, channels) layout
+            clean, sr = _load_audio(input_file)
             
-            # Generate noise
-            if len(audio.shape) == 1:
-                # Mono
-                noise = np.random.normal(0, noise_level, audio.shape)
-            else:
-                # Stereo
-                noise = np.random.normal(0, noise_level, audio.shape)
-            
-            # Add noise
-            noisy_audio = audio + noise
+            # Generate noise and add the (read-only, cached) signal into it
+            audio = _RNG.standard_normal(clean.shape, dtype=np.float32)
+            audio *= np.float32(noise_level)
+            np.add(audio, clean, out=audio)
             
-            # Ensure we don't clip
-            max_val = np.max(np.abs(noisy_audio))
+            # Ensure we don't clip (peak found without an abs() copy, rescaled in place)
+            max_val = max(audio.max(), -audio.min()) if audio.size else 0.0
             if max_val > 1.0:
-                noisy_audio = noisy_audio / max_val
+                np.multiply(audio, np.float32(1.0 / max_val), out=audio)
             
-            # Save
-            sf.write(output_file, noisy_audio.T if len(noisy_audio.shape) > 1 else noisy_audio, sr)
+            # Save as 16-bit PCM; libsndfile converts the float32 samples in one C pass
+            sf.write(output_file, audio, sr, subtype='PCM_16')
             return True
             
         except Exception as e:
@@ -116,13 +185,14 @@ class AudioProcessor:
         """
         try:
             cmd = [
-                'sox', input_file, 
+                SOX, input_file, 
                 '-r', str(sample_rate),
                 '-c', str(channels),
                 '-b', '16',
                 output_file
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # Only the exit status is used, so sox's output is not collected
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             return result.returncode == 0
         except Exception as e:
             print(f"Error converting to WAV: {e}")
@@ -162,7 +232,9 @@ class AudioProcessor:
                 audio_file
             ])
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # stdout is only wanted when verbose (shown directly); stderr is kept for the error message
+            result = subprocess.run(cmd, stdout=None if verbose else subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, text=True)
             
             if result.returncode != 0:
                 print(f"GetMaxFreqs error: {result.stderr}")
@@ -182,7 +254,7 @@ class AudioProcessor:
         
         Args:
             audio_file: Input audio file path
-            output_dir: Output directory for segments
+            output_dir: Existing output directory for segments (created once by the caller)
             segment_duration: Duration of each segment in seconds
             num_segments: Number of segments to generate
             
@@ -192,16 +264,31 @@ class AudioProcessor:
         segments = []
         
         try:
-            # Get audio duration
-            duration = librosa.get_duration(path=audio_file)
+            # The header alone gives the duration, so short files are rejected before decoding
+            try:
+                info = sf.info(audio_file)
+                duration = info.duration
+            except (RuntimeError, TypeError, ValueError):
+                # soundfile cannot read this format; each segment goes through sox
+                info = None
+                duration = librosa.get_duration(path=audio_file)
             
             if duration <= segment_duration:
                 print(f"Audio file too short for {segment_duration}s segments")
                 return segments
             
-            os.makedirs(output_dir, exist_ok=True)
+            # Decode the file once and cut every segment from memory; a song is never
+            # read again, so it bypasses the _load_audio cache
+            audio, sr = (sf.read(audio_file, dtype='float32', always_2d=True)
+                         if info is not None else (None, None))
+            
             base_name = Path(audio_file).stem
             
+            # Keep the source sample format for WAV sources, as sox trim would
+            subtype = None
+            if info is not None and Path(audio_file).suffix.lower() == '.wav':
+                subtype = info.subtype
+            
             for i in range(num_segments):
                 # Random start time
                 max_start = duration - segment_duration
@@ -209,7 +296,12 @@ class AudioProcessor:
                 
                 segment_file = os.path.join(output_dir, f"{base_name}_segment_{i+1:02d}.wav")
                 
-                if self.extract_segment(audio_file, segment_file, start_time, segment_duration):
+                if audio is not None:
+                    start = int(round(start_time * sr))
+                    sf.write(segment_file, audio[start:start + int(round(segment_duration * sr))], sr,
+                             subtype=subtype)
+                    segments.append(segment_file)
+                elif self.extract_segment(audio_file, segment_file, start_time, segment_duration):
                     segments.append(segment_file)
                     
         except Exception as e:
@@ -230,20 +322,24 @@ class AudioProcessor:
         Returns:
             List of generated signature file paths
         """
-        signatures = []
         os.makedirs(signature_dir, exist_ok=True)
         
-        for audio_file in audio_files:
+        def process(audio_file: str) -> Optional[str]:
             base_name = Path(audio_file).stem
             signature_file = os.path.join(signature_dir, f"{base_name}.freqs")
             
             if self.generate_signature(audio_file, signature_file, **kwargs):
-                signatures.append(signature_file)
                 print(f"Generated signature for {base_name}")
-            else:
-                print(f"Failed to generate signature for {base_name}")
+                return signature_file
+            print(f"Failed to generate signature for {base_name}")
+            return None
+        
+        # Each file is its own GetMaxFreqs process, so threads are enough to keep
+        # every core busy; map returns the signatures in input order
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(process, audio_files))
         
-        return signatures
+        return [signature_file for signature_file in results if signature_file is not None]
 
 
 def main():
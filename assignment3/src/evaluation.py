@@ -4,13 +4,38 @@ Evaluation Module
 Tools for evaluating music identification performance.
 """
 
+import ast
+import io
+import re
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
 import seaborn as sns
 from typing import List, Dict, Tuple
 from pathlib import Path
 
+# Repeated labels used as groupby keys; read straight into categoricals
+CATEGORICAL_COLUMNS = ('compressor', 'query', 'true_song', 'predicted')
+
+# Explicit dtypes so read_csv does not have to infer them
+COLUMN_DTYPES = {
+    'ncd_value': 'float64',
+    'processing_time': 'float64',
+    'correct': 'boolean',
+    **{c: 'category' for c in CATEGORICAL_COLUMNS},
+}
+
+# Noise level embedded in query names (file stems), e.g. song_segment_01_noise_0.050
+_NOISE_RE = re.compile(r'_noise_(\d+(?:\.\d+)?)')
+
+
+def _parse_matches(value: str) -> List[str]:
+    """Parse a list of matches as written to CSV by pandas (its Python repr)."""
+    return ast.literal_eval(value) if value else []
+
 
 class MusicIdentificationEvaluator:
     """Evaluate music identification results."""
@@ -20,7 +45,9 @@ class MusicIdentificationEvaluator:
     
     def load_results(self, csv_file: str):
         """Load results from CSV file."""
-        self.results_df = pd.read_csv(csv_file)
+        # top_5_matches is parsed into lists once, while the CSV is read
+        self.results_df = pd.read_csv(csv_file, converters={'top_5_matches': _parse_matches},
+                                      dtype=COLUMN_DTYPES)
         return self.results_df
     
     def calculate_metrics(self, df: pd.DataFrame = None) -> Dict:
@@ -32,6 +59,16 @@ class MusicIdentificationEvaluator:
             raise ValueError("No results loaded")
         
         metrics = {}
+        has_truth = 'correct' in df.columns and df['correct'].notna().any()
+        
+        # Every overall and per-compressor statistic in one pass each
+        overall_aggs = {'ncd_value': ['mean', 'std', 'min', 'max'], 'processing_time': ['mean']}
+        compressor_aggs = {'ncd_value': ['mean', 'std'], 'processing_time': ['mean']}
+        if has_truth:
+            overall_aggs['correct'] = ['mean']
+            compressor_aggs['correct'] = ['mean']
+        overall = df.agg(overall_aggs)
+        by_compressor = df.groupby('compressor', sort=False, observed=True).agg(compressor_aggs)
         
         # Basic statistics
         metrics['total_queries'] = len(df)
@@ -39,33 +76,41 @@ class MusicIdentificationEvaluator:
         metrics['compressors_tested'] = df['compressor'].unique().tolist()
         
         # Accuracy metrics (if ground truth available)
-        if 'correct' in df.columns and df['correct'].notna().any():
-            metrics['overall_accuracy'] = df['correct'].mean()
-            metrics['accuracy_by_compressor'] = df.groupby('compressor')['correct'].mean().to_dict()
+        if has_truth:
+            metrics['overall_accuracy'] = overall.loc['mean', 'correct']
+            metrics['accuracy_by_compressor'] = by_compressor[('correct', 'mean')].to_dict()
             
             # Top-k accuracy (assuming we have top_5_matches)
             if 'top_5_matches' in df.columns:
                 top_k_accuracies = {}
+                valid = df['true_song'].notna()
+                top_matches = df.loc[valid, 'top_5_matches'].map(
+                    lambda m: ast.literal_eval(m) if isinstance(m, str) else m
+                )
+                true_songs = np.asarray(df.loc[valid, 'true_song'].astype(str).tolist(), dtype=str)
+                
+                # (queries x 5) matrix of match names, padded where fewer were returned
+                n_top = 5
+                matches = np.array([list(m[:n_top]) + [''] * (n_top - len(m[:n_top])) for m in top_matches],
+                                   dtype=str).reshape(-1, n_top)
+                present = np.arange(n_top) < top_matches.map(lambda m: len(m[:n_top])).to_numpy()[:, None]
+                # A hit is the true song name appearing inside the matched name
+                hits = (np.char.find(matches, true_songs[:, None]) >= 0) & present
+                
                 for k in [1, 3, 5]:
-                    correct_in_top_k = []
-                    for _, row in df.iterrows():
-                        if pd.isna(row['true_song']):
-                            continue
-                        top_matches = eval(row['top_5_matches']) if isinstance(row['top_5_matches'], str) else row['top_5_matches']
-                        correct_in_top_k.append(any(row['true_song'] in match for match in top_matches[:k]))
-                    top_k_accuracies[f'top_{k}_accuracy'] = np.mean(correct_in_top_k) if correct_in_top_k else 0
+                    top_k_accuracies[f'top_{k}_accuracy'] = hits[:, :k].any(axis=1).mean() if len(hits) else 0
                 metrics.update(top_k_accuracies)
         
         # NCD statistics
-        metrics['mean_ncd'] = df['ncd_value'].mean()
-        metrics['std_ncd'] = df['ncd_value'].std()
-        metrics['min_ncd'] = df['ncd_value'].min()
-        metrics['max_ncd'] = df['ncd_value'].max()
-        metrics['ncd_by_compressor'] = df.groupby('compressor')['ncd_value'].agg(['mean', 'std']).to_dict()
+        metrics['mean_ncd'] = overall.loc['mean', 'ncd_value']
+        metrics['std_ncd'] = overall.loc['std', 'ncd_value']
+        metrics['min_ncd'] = overall.loc['min', 'ncd_value']
+        metrics['max_ncd'] = overall.loc['max', 'ncd_value']
+        metrics['ncd_by_compressor'] = by_compressor['ncd_value'].to_dict()
         
         # Performance metrics
-        metrics['mean_processing_time'] = df['processing_time'].mean()
-        metrics['processing_time_by_compressor'] = df.groupby('compressor')['processing_time'].mean().to_dict()
+        metrics['mean_processing_time'] = overall.loc['mean', 'processing_time']
+        metrics['processing_time_by_compressor'] = by_compressor[('processing_time', 'mean')].to_dict()
         
         return metrics
     
@@ -74,7 +119,7 @@ class MusicIdentificationEvaluator:
         if df is None:
             df = self.results_df
         
-        summary = df.groupby('compressor').agg({
+        summary = df.groupby('compressor', observed=True).agg({
             'ncd_value': ['mean', 'std', 'min', 'max'],
             'processing_time': ['mean', 'std'],
             'correct': 'mean' if 'correct' in df.columns else lambda x: None
@@ -96,37 +141,23 @@ class MusicIdentificationEvaluator:
         # Filter out rows without ground truth
         valid_df = df.dropna(subset=['true_song'])
         
-        confusion_data = []
-        for _, row in valid_df.iterrows():
-            confusion_data.append({
-                'true_song': row['true_song'],
-                'predicted_song': row['predicted'],
-                'correct': row['correct'] if 'correct' in row else None,
-                'ncd_value': row['ncd_value'],
-                'compressor': row['compressor']
-            })
-        
-        return pd.DataFrame(confusion_data)
+        # Plain column projection; a missing 'correct' column comes back as NaN
+        return valid_df.reindex(
+            columns=['true_song', 'predicted', 'correct', 'ncd_value', 'compressor']
+        ).rename(columns={'predicted': 'predicted_song'}).reset_index(drop=True)
     
     def noise_robustness_analysis(self, df: pd.DataFrame = None) -> pd.DataFrame:
         """Analyze robustness to noise."""
         if df is None:
             df = self.results_df
         
-        # Extract noise level from query names
-        def extract_noise_level(query_name):
-            if '_noise_' in query_name:
-                try:
-                    return float(query_name.split('_noise_')[1].split('_')[0])
-                except:
-                    return None
-            return 0.0
-        
-        df_copy = df.copy()
-        df_copy['noise_level'] = df_copy['query'].apply(extract_noise_level)
+        # Extract noise level from query names; clean queries are 0.0
+        raw_level = df['query'].str.extract(_NOISE_RE, expand=False)
+        # Grouping by a separate Series leaves the results table untouched, so no copy is needed
+        noise_level = pd.to_numeric(raw_level).fillna(0.0).rename('noise_level')
         
         # Group by noise level and compressor
-        noise_analysis = df_copy.groupby(['noise_level', 'compressor']).agg({
+        noise_analysis = df.groupby([noise_level, 'compressor'], observed=True).agg({
             'ncd_value': ['mean', 'std'],
             'correct': 'mean' if 'correct' in df.columns else lambda x: None,
             'processing_time': 'mean'
@@ -142,65 +173,70 @@ class MusicIdentificationEvaluator:
         metrics = self.calculate_metrics()
         compressor_perf = self.analyze_compressor_performance()
         
-        report = []
-        report.append("MUSIC IDENTIFICATION EVALUATION REPORT")
-        report.append("=" * 50)
-        report.append("")
+        # Lines are printed straight into one buffer instead of collected in a list and joined
+        buffer = io.StringIO()
+        
+        def line(text=""):
+            print(text, file=buffer)
+        
+        line("MUSIC IDENTIFICATION EVALUATION REPORT")
+        line("=" * 50)
+        line()
         
         # Basic statistics
-        report.append("BASIC STATISTICS:")
-        report.append(f"Total queries tested: {metrics['total_queries']}")
-        report.append(f"Unique queries: {metrics['unique_queries']}")
-        report.append(f"Compressors tested: {', '.join(metrics['compressors_tested'])}")
-        report.append("")
+        line("BASIC STATISTICS:")
+        line(f"Total queries tested: {metrics['total_queries']}")
+        line(f"Unique queries: {metrics['unique_queries']}")
+        line(f"Compressors tested: {', '.join(metrics['compressors_tested'])}")
+        line()
         
         # Accuracy results
         if 'overall_accuracy' in metrics:
-            report.append("ACCURACY RESULTS:")
-            report.append(f"Overall accuracy: {metrics['overall_accuracy']:.3f}")
-            report.append("Accuracy by compressor:")
+            line("ACCURACY RESULTS:")
+            line(f"Overall accuracy: {metrics['overall_accuracy']:.3f}")
+            line("Accuracy by compressor:")
             for comp, acc in metrics['accuracy_by_compressor'].items():
-                report.append(f"  {comp:10s}: {acc:.3f}")
+                line(f"  {comp:10s}: {acc:.3f}")
             
             # Top-k accuracy
             for k in [1, 3, 5]:
                 key = f'top_{k}_accuracy'
                 if key in metrics:
-                    report.append(f"Top-{k} accuracy: {metrics[key]:.3f}")
-            report.append("")
+                    line(f"Top-{k} accuracy: {metrics[key]:.3f}")
+            line()
         
         # NCD statistics
-        report.append("NCD STATISTICS:")
-        report.append(f"Mean NCD: {metrics['mean_ncd']:.4f} ± {metrics['std_ncd']:.4f}")
-        report.append(f"NCD range: [{metrics['min_ncd']:.4f}, {metrics['max_ncd']:.4f}]")
-        report.append("Mean NCD by compressor:")
+        line("NCD STATISTICS:")
+        line(f"Mean NCD: {metrics['mean_ncd']:.4f} ± {metrics['std_ncd']:.4f}")
+        line(f"NCD range: [{metrics['min_ncd']:.4f}, {metrics['max_ncd']:.4f}]")
+        line("Mean NCD by compressor:")
         for comp in metrics['compressors_tested']:
             mean_ncd = metrics['ncd_by_compressor']['mean'][comp]
             std_ncd = metrics['ncd_by_compressor']['std'][comp]
-            report.append(f"  {comp:10s}: {mean_ncd:.4f} ± {std_ncd:.4f}")
-        report.append("")
+            line(f"  {comp:10s}: {mean_ncd:.4f} ± {std_ncd:.4f}")
+        line()
         
         # Performance statistics
-        report.append("PERFORMANCE STATISTICS:")
-        report.append(f"Mean processing time: {metrics['mean_processing_time']:.3f}s")
-        report.append("Processing time by compressor:")
+        line("PERFORMANCE STATISTICS:")
+        line(f"Mean processing time: {metrics['mean_processing_time']:.3f}s")
+        line("Processing time by compressor:")
         for comp, time_val in metrics['processing_time_by_compressor'].items():
-            report.append(f"  {comp:10s}: {time_val:.3f}s")
-        report.append("")
+            line(f"  {comp:10s}: {time_val:.3f}s")
+        line()
         
         # Detailed compressor analysis
-        report.append("DETAILED COMPRESSOR ANALYSIS:")
-        report.append(compressor_perf.to_string())
-        report.append("")
+        line("DETAILED COMPRESSOR ANALYSIS:")
+        line(compressor_perf.to_string())
+        line()
         
         # Noise robustness (if applicable)
         noise_analysis = self.noise_robustness_analysis()
         if not noise_analysis.empty:
-            report.append("NOISE ROBUSTNESS ANALYSIS:")
-            report.append(noise_analysis.to_string())
-            report.append("")
+            line("NOISE ROBUSTNESS ANALYSIS:")
+            line(noise_analysis.to_string())
+            line()
         
-        report_text = "\n".join(report)
+        report_text = buffer.getvalue()[:-1]
         
         if output_file:
             with open(output_file, 'w') as f:
@@ -232,7 +268,7 @@ class MusicIdentificationEvaluator:
         
         # 2. Processing time comparison
         plt.subplot(2, 2, 2)
-        time_stats = df.groupby('compressor')['processing_time'].mean()
+        time_stats = df.groupby('compressor', observed=True)['processing_time'].mean()
         bars = plt.bar(time_stats.index, time_stats.values)
         plt.title('Average Processing Time')
         plt.ylabel('Time (seconds)')
@@ -246,7 +282,7 @@ class MusicIdentificationEvaluator:
         # 3. Accuracy comparison (if available)
         if 'correct' in df.columns and df['correct'].notna().any():
             plt.subplot(2, 2, 3)
-            acc_stats = df.groupby('compressor')['correct'].mean()
+            acc_stats = df.groupby('compressor', observed=True)['correct'].mean()
             bars = plt.bar(acc_stats.index, acc_stats.values)
             plt.title('Identification Accuracy')
             plt.ylabel('Accuracy')
@@ -257,16 +293,16 @@ class MusicIdentificationEvaluator:
                 plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.01,
                         f'{value:.3f}', ha='center', va='bottom', fontsize=8)
         
-        # 4. NCD vs Processing Time scatter
+        # 4. NCD vs Processing Time scatter, one rasterized draw call coloured by compressor
         plt.subplot(2, 2, 4)
-        for comp in df['compressor'].unique():
-            comp_data = df[df['compressor'] == comp]
-            plt.scatter(comp_data['processing_time'], comp_data['ncd_value'], 
-                       label=comp, alpha=0.6)
+        codes, compressors = pd.factorize(df['compressor'])
+        scatter = plt.scatter(df['processing_time'], df['ncd_value'], c=codes,
+                              cmap=ListedColormap(sns.color_palette(n_colors=max(len(compressors), 1))),
+                              vmin=-0.5, vmax=max(len(compressors), 1) - 0.5, alpha=0.6, rasterized=True)
         plt.xlabel('Processing Time (s)')
         plt.ylabel('NCD Value')
         plt.title('NCD vs Processing Time')
-        plt.legend()
+        plt.legend(scatter.legend_elements()[0], list(compressors))
         
         plt.tight_layout()
         plt.savefig(output_path / 'performance_comparison.png', dpi=300, bbox_inches='tight')
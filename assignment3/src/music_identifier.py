@@ -7,14 +7,53 @@ Main system for identifying music segments using frequency signatures and compre
 import os
 import json
 import subprocess
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 import pandas as pd
 
 from ncd_calculator import NCDCalculator
-from audio_processor import AudioProcessor
+from audio_processor import AudioProcessor, SOX
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the json module is used instead
+    orjson = None
+
+
+# Bump whenever the layout of database_info.json changes
+DATABASE_INFO_VERSION = 2
+
+# Songs behind the professor's sample queries (sample01.wav ... sample07.wav)
+_SAMPLE_TRUTH = {
+    "sample01": "Rainbow - I Surrender",
+    "sample02": "Carlos Paredes - Canção Verdes Anos [Official Audio]",
+    "sample03": "Ultravox - All Stood Still",
+    "sample04": "Mozart Requiem Sanctus",
+    "sample05": "Quinta Sinfonia - 1º movimento - Beethoven",  # Beethoven / Karajan, Sinfonia nº 5, 1º Andamento (20 seg)
+    "sample06": "Vangelis - Spiral (Audio)",
+    "sample07": "Metallica： The Memory Remains (Official Music Video)",
+}
+
+
+def _write_json(path, data):
+    """Write data as indented JSON (with orjson when it is installed)."""
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+
+def _read_json(path):
+    """Read a JSON file (with orjson when it is installed)."""
+    if orjson is not None:
+        return orjson.loads(Path(path).read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 
 @dataclass
@@ -46,22 +85,29 @@ class MusicIdentifier:
         self.signatures_dir = Path(signatures_dir)
         self.db_signatures_dir = self.signatures_dir / "database"
         self.query_signatures_dir = self.signatures_dir / "queries"
+        self.query_temp_dir = self.query_signatures_dir / "temp"
         
-        # Create directories
-        for dir_path in [self.signatures_dir, self.db_signatures_dir, self.query_signatures_dir]:
+        # Create directories once here rather than around every query
+        for dir_path in [self.signatures_dir, self.db_signatures_dir, self.query_signatures_dir,
+                         self.query_temp_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
         
         self.audio_processor = AudioProcessor(getmaxfreqs_path)
         self.ncd_calculator = NCDCalculator()
         self.database_signatures = []
         self.music_database = {}
+        self.zstd_dictionary_file = None
+        self.signature_pack = None
     
-    def build_database(self, signature_params: Dict = None) -> bool:
+    def build_database(self, signature_params: Dict = None,
+                       zstd_dictionary: bool = False) -> bool:
         """
         Build signature database from audio files.
         
         Args:
             signature_params: Parameters for signature generation
+            zstd_dictionary: Train a zstd dictionary on the database signatures
+                and use it for all zstd NCD computations
             
         Returns:
             True if successful, False otherwise
@@ -76,72 +122,127 @@ class MusicIdentifier:
         
         print("Building signature database...")
         
-        # Find all audio files
-        audio_extensions = ['.wav', '.flac', '.mp3']
-        audio_files = []
-        
-        for ext in audio_extensions:
-            audio_files.extend(list(self.database_dir.glob(f"*{ext}")))
-            #audio_files.extend(list(self.database_dir.glob(f"**/*{ext}")))
+        # Find all audio files in one pass over the directory
+        audio_extensions = ('.wav', '.flac', '.mp3')
+        with os.scandir(self.database_dir) as entries:
+            audio_files = [Path(entry.path) for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(audio_extensions)]
         
         if len(audio_files) < 25:
             print(f"Warning: Only {len(audio_files)} audio files found. Need at least 25.")
         
         print(f"Found {len(audio_files)} audio files")
         
-        # Generate signatures
-        successful = 0
-        temp_dir = self.signatures_dir / "temp"
-        temp_dir.mkdir(exist_ok=True)
+        # Signature files are about to be rewritten, so cached signatures and sizes are stale
+        self.ncd_calculator.clear_cache()
         
-        for audio_file in audio_files:
-            signature_file = self.db_signatures_dir / f"{audio_file.stem}.freqs"
-            
-            try:
-                # Convert to stereo WAV if needed
-                temp_wav = temp_dir / f"{audio_file.stem}_converted.wav"
-                conversion_cmd = [
-                    'sox', str(audio_file), '-c', '2',  # Force stereo
-                    '-r', '44100',  # Standard sample rate
-                    str(temp_wav)
-                ]
-                
-                subprocess.run(conversion_cmd, check=True, capture_output=True)
-                
-                # Generate signature from converted file
-                if self.audio_processor.generate_signature(
-                    str(temp_wav), str(signature_file), **signature_params
-                ):
-                    self.database_signatures.append(str(signature_file))
-                    self.music_database[audio_file.stem] = str(audio_file)
-                    successful += 1
-                    print(f"Generated signature for {audio_file.name}")
-                else:
-                    print(f"Failed to generate signature for {audio_file.name}")
-                    
-                # Clean up temp file
-                temp_wav.unlink(missing_ok=True)
-                
-            except Exception as e:
-                print(f"Error processing {audio_file.name}: {e}")
-                continue
+        # Generate signatures; the temp directory is removed with whatever is left in it
+        with tempfile.TemporaryDirectory(dir=self.signatures_dir) as temp_dir:
+            # sox and GetMaxFreqs run as separate processes writing to distinct files,
+            # so the files can be converted concurrently; map keeps the directory order
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                signature_files = list(executor.map(
+                    lambda audio_file: self._build_signature(audio_file, Path(temp_dir), signature_params),
+                    audio_files
+                ))
         
-        # Clean up temp directory
-        temp_dir.rmdir()
+        successful = 0
+        for audio_file, signature_file in zip(audio_files, signature_files):
+            if signature_file is not None:
+                self.database_signatures.append(signature_file)
+                self.music_database[audio_file.stem] = str(audio_file)
+                successful += 1
         
         print(f"Successfully generated {successful} signatures")
         
+        dict_bytes = None
+        if zstd_dictionary:
+            dict_bytes = self.ncd_calculator.train_zstd_dictionary(self.database_signatures)
+        self._set_zstd_dictionary(dict_bytes)
+        
+        # Load every database signature and its C(y), so identification never rereads or recompresses them
+        self.ncd_calculator.precompute_sizes(self.database_signatures)
+        
+        # All signatures in one file, so loading the database maps one file instead of opening every signature
+        pack_file = self.signatures_dir / "database.bin"
+        self.signature_pack = {
+            'file': str(pack_file),
+            'offsets': self.ncd_calculator.pack_signatures(self.database_signatures, str(pack_file))
+        }
+        
         # Save database info
+        self._save_database_info(signature_params)
+        
+        return successful > 0
+    
+    def _save_database_info(self, signature_params: Dict):
+        """Write database_info.json, including the cached compressed sizes."""
         db_info = {
+            'version': DATABASE_INFO_VERSION,
             'signatures': self.database_signatures,
             'music_files': self.music_database,
-            'signature_params': signature_params
+            'signature_params': signature_params,
+            'compressed_sizes': self.ncd_calculator.export_sizes(),
+            'zstd_dictionary': self.zstd_dictionary_file,
+            'signature_pack': self.signature_pack
         }
         
-        with open(self.signatures_dir / "database_info.json", 'w') as f:
-            json.dump(db_info, f, indent=2)
+        _write_json(self.signatures_dir / "database_info.json", db_info)
+    
+    def _build_signature(self, audio_file: Path, temp_dir: Path,
+                         signature_params: Dict) -> Optional[str]:
+        """Convert one database file and generate its signature; returns the signature path or None."""
+        signature_file = self.db_signatures_dir / f"{audio_file.stem}.freqs"
         
-        return successful > 0
+        try:
+            # Convert to stereo WAV if needed; a 44.1 kHz stereo WAV is used as it is,
+            # since sox would only copy it
+            temp_wav = None
+            source = str(audio_file)
+            if not self.audio_processor.is_standard_wav(audio_file):
+                temp_wav = temp_dir / f"{audio_file.stem}_converted.wav"
+                conversion_cmd = [
+                    SOX, str(audio_file), '-c', '2',  # Force stereo
+                    '-r', '44100',  # Standard sample rate
+                    str(temp_wav)
+                ]
+                
+                # sox's stdout is never used; stderr is kept for the CalledProcessError
+                subprocess.run(conversion_cmd, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                source = str(temp_wav)
+            
+            # Generate signature from converted file
+            generated = self.audio_processor.generate_signature(
+                source, str(signature_file), **signature_params
+            )
+            
+            # Clean up temp file
+            if temp_wav is not None:
+                temp_wav.unlink(missing_ok=True)
+            
+            if generated:
+                print(f"Generated signature for {audio_file.name}")
+                return str(signature_file)
+            
+            print(f"Failed to generate signature for {audio_file.name}")
+            return None
+            
+        except Exception as e:
+            print(f"Error processing {audio_file.name}: {e}")
+            return None
+    
+    def _set_zstd_dictionary(self, dict_bytes: Optional[bytes]):
+        """Use (and keep next to database_info.json) a zstd dictionary, or none."""
+        self.ncd_calculator.set_zstd_dictionary(dict_bytes)
+        dict_file = self.signatures_dir / "zstd.dict"
+        
+        if dict_bytes:
+            dict_file.write_bytes(dict_bytes)
+            self.zstd_dictionary_file = str(dict_file)
+        else:
+            dict_file.unlink(missing_ok=True)
+            self.zstd_dictionary_file = None
     
     def load_database(self) -> bool:
         """Load existing signature database."""
@@ -152,12 +253,20 @@ class MusicIdentifier:
             return False
         
         try:
-            with open(db_info_file, 'r') as f:
-                db_info = json.load(f)
+            db_info = _read_json(db_info_file)
             
             self.database_signatures = db_info['signatures']
             self.music_database = db_info['music_files']
             
+            # Serve the signatures from the memory-mapped pack when there is one
+            self.signature_pack = db_info.get('signature_pack')
+            if self.signature_pack and os.path.exists(self.signature_pack['file']):
+                self.ncd_calculator.load_signature_pack(
+                    self.signature_pack['file'], self.database_signatures, self.signature_pack['offsets']
+                )
+            else:
+                self.signature_pack = None
+            
             # Verify signatures exist
             existing_signatures = []
             for sig_file in self.database_signatures:
@@ -165,6 +274,24 @@ class MusicIdentifier:
                     existing_signatures.append(sig_file)
             
             self.database_signatures = existing_signatures
+            
+            # Without a pack, read every signature up front so queries never touch the files
+            if self.signature_pack is None:
+                self.ncd_calculator.preload_signatures(self.database_signatures)
+            
+            # The dictionary has to be in place before any zstd size is used
+            self.zstd_dictionary_file = db_info.get('zstd_dictionary')
+            if self.zstd_dictionary_file:
+                self.ncd_calculator.set_zstd_dictionary(Path(self.zstd_dictionary_file).read_bytes())
+            
+            if db_info.get('version') == DATABASE_INFO_VERSION:
+                self.ncd_calculator.load_sizes(db_info['compressed_sizes'])
+            else:
+                # Database from before sizes were stored: compute them once and save
+                print("Computing compressed sizes for an older database...")
+                self.ncd_calculator.precompute_sizes(self.database_signatures)
+                self._save_database_info(db_info.get('signature_params'))
+            
             print(f"Loaded {len(self.database_signatures)} signatures")
             return len(self.database_signatures) > 0
             
@@ -176,12 +303,13 @@ class MusicIdentifier:
         """Convert audio to standard format (stereo, 44.1kHz)."""
         try:
             cmd = [
-                'sox', str(input_file),
+                SOX, str(input_file),
                 '-c', '2',  # Force stereo
                 '-r', '44100',  # Standard sample rate
                 str(output_file)
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            # Only stderr is read, and only when sox fails
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
             return True
         except subprocess.CalledProcessError as e:
             print(f"Sox conversion failed: {e.stderr.decode()}")
@@ -197,7 +325,43 @@ class MusicIdentifier:
         Identify music from query segment.
         """
         start_time = time.time()
+        query_signature = self.generate_query_signature(
+            query_file, signature_params, add_noise, noise_level
+        )
+        return self.match_signature(
+            query_file, query_signature, compressor, noise_level, time.time() - start_time
+        )
+    
+    def standardize_query(self, query_file: str) -> Tuple[str, Optional[Path]]:
+        """
+        Bring a query into the standard format (stereo, 44.1kHz WAV).
+        
+        Returns:
+            (file to use, temp file created for it or None if the query already was standard)
+        """
+        if self.audio_processor.is_standard_wav(query_file):
+            return str(query_file), None
+        
+        temp_wav = self.query_temp_dir / f"{Path(query_file).stem}_standardized.wav"
+        if not self.standardize_audio(query_file, temp_wav):
+            raise RuntimeError(f"Failed to standardize {query_file}")
+        return str(temp_wav), temp_wav
+    
+    def generate_query_signature(self, query_file: str, signature_params: Dict = None,
+                                 add_noise: bool = False, noise_level: float = 0.05,
+                                 standardized_file: str = None) -> str:
+        """
+        Standardize a query, optionally add noise, and generate its signature.
+        The signature does not depend on the compressor, so it can be matched
+        with every compressor without being regenerated.
+        
+        Args:
+            standardized_file: Output of standardize_query for this query, if the
+                caller already has it (the caller then also removes it)
         
+        Returns:
+            Path to the query signature file
+        """
         if signature_params is None:
             signature_params = {
                 'win_size': 1024,
@@ -207,18 +371,18 @@ class MusicIdentifier:
             }
         
         query_path = Path(query_file)
-        temp_dir = self.query_signatures_dir / "temp"
-        temp_dir.mkdir(exist_ok=True)
+        temp_dir = self.query_temp_dir
         
         try:
-            # First standardize the audio format
-            temp_wav = temp_dir / f"{query_path.stem}_standardized.wav"
-            if not self.standardize_audio(query_file, temp_wav):
-                raise RuntimeError(f"Failed to standardize {query_file}")
-            
-            processed_query = str(temp_wav)
+            # First standardize the audio format, unless the caller already did
+            temp_wav = None
+            if standardized_file is None:
+                processed_query, temp_wav = self.standardize_query(query_file)
+            else:
+                processed_query = str(standardized_file)
             
             # Add noise if requested
+            noisy_file = None
             if add_noise:
                 noisy_file = temp_dir / f"{query_path.stem}_noisy.wav"
                 if self.audio_processor.add_noise(processed_query, str(noisy_file), noise_level):
@@ -233,26 +397,33 @@ class MusicIdentifier:
             ):
                 raise RuntimeError(f"Failed to generate signature for {query_file}")
             
-            # Compare with database
-            matches = self.ncd_calculator.batch_compare(
-                str(query_signature), self.database_signatures, compressor
-            )
-            
-            # Clean up temp files
-            temp_wav.unlink(missing_ok=True)
-            if add_noise and processed_query != str(temp_wav):
-                Path(processed_query).unlink(missing_ok=True)
+            # Clean up temp files (never the query itself)
+            for temp_file in (temp_wav, noisy_file):
+                if temp_file is not None:
+                    temp_file.unlink(missing_ok=True)
                 
         except Exception as e:
             raise RuntimeError(f"Failed to process {query_file}: {e}")
-        finally:
-            # Clean up temp directory if empty
-            try:
-                temp_dir.rmdir()
-            except:
-                pass
         
-        processing_time = time.time() - start_time
+        return str(query_signature)
+    
+    def match_signature(self, query_file: str, query_signature: str, compressor: str = 'gzip',
+                        noise_level: float = 0.0, signature_time: float = 0.0,
+                        top_n: int = None) -> IdentificationResult:
+        """
+        Compare a query signature with the database.
+        signature_time is the time spent producing the signature and is added
+        to the reported processing time. top_n (opt-in, see NCDCalculator.batch_compare)
+        skips database entries that cannot be among the best top_n matches.
+        """
+        start_time = time.time()
+        
+        # Compare with database
+        matches = self.ncd_calculator.batch_compare(
+            query_signature, self.database_signatures, compressor, top_n=top_n
+        )
+        
+        processing_time = signature_time + (time.time() - start_time)
         
         best_match = matches[0] if matches else ("Unknown", 1.0)
         
@@ -292,20 +463,52 @@ class MusicIdentifier:
         print(f"Running {total_tests} identification tests...")
         
         for query_file in query_files:
-            for compressor in compressors:
+            query_results = {}
+            
+            # Standardize once per query; every noise level starts from the same file
+            try:
+                start_time = time.time()
+                standardized_file, temp_wav = self.standardize_query(query_file)
+                standardize_time = time.time() - start_time
+            except Exception as e:
+                test_count += len(compressors) * len(add_noise_levels)
+                print(f"Error in test: {e}")
+                continue
+            
+            try:
+                # One signature per noise level, shared by every compressor
                 for noise_level in add_noise_levels:
-                    test_count += 1
-                    print(f"Test {test_count}/{total_tests} - {Path(query_file).name} - {compressor} - noise:{noise_level}")
-                    
                     try:
-                        result = self.identify_music(
-                            query_file, compressor, 
-                            add_noise=(noise_level > 0), 
-                            noise_level=noise_level
+                        start_time = time.time()
+                        query_signature = self.generate_query_signature(
+                            query_file, add_noise=(noise_level > 0), noise_level=noise_level,
+                            standardized_file=standardized_file
                         )
-                        results.append(result)
+                        signature_time = standardize_time + (time.time() - start_time)
                     except Exception as e:
+                        test_count += len(compressors)
                         print(f"Error in test: {e}")
+                        continue
+                    
+                    for compressor in compressors:
+                        test_count += 1
+                        print(f"Test {test_count}/{total_tests} - {Path(query_file).name} - {compressor} - noise:{noise_level}")
+                        
+                        try:
+                            query_results[(compressor, noise_level)] = self.match_signature(
+                                query_file, query_signature, compressor, noise_level, signature_time
+                            )
+                        except Exception as e:
+                            print(f"Error in test: {e}")
+            finally:
+                if temp_wav is not None:
+                    temp_wav.unlink(missing_ok=True)
+            
+            # Report in the usual query -> compressor -> noise level order
+            for compressor in compressors:
+                for noise_level in add_noise_levels:
+                    if (compressor, noise_level) in query_results:
+                        results.append(query_results[(compressor, noise_level)])
         
         return results
     
@@ -338,29 +541,7 @@ class MusicIdentifier:
                     true_song = query_name.split('_')[0]
                 # if its a sample from professor, it might be like "sample1"
                 elif query_name.startswith("sample"):
-                    # sample01.wav: Rainbow - I Surrender
-                    # sample02.wav: Carlos Paredes - Canção Verdes Anos [Official Audio]
-                    # sample03.wav: Ultravox - All Stood Still
-                    # sample04.wav: Mozart Requiem Sanctus
-                    # sample05.wav: Beethoven / Karajan, Sinfonia nº 5, 1º Andamento (20 seg)
-                    # sample06.wav: Vangelis - Spiral (Audio)
-                    # sample07.wav: Metallica： The Memory Remains (Official Music Video)
-                    if query_name == "sample01":
-                        true_song = "Rainbow - I Surrender"
-                    elif query_name == "sample02":
-                        true_song = "Carlos Paredes - Canção Verdes Anos [Official Audio]"
-                    elif query_name == "sample03":
-                        true_song = "Ultravox - All Stood Still"
-                    elif query_name == "sample04":
-                        true_song = "Mozart Requiem Sanctus"
-                    elif query_name == "sample05":
-                        true_song = "Quinta Sinfonia - 1º movimento - Beethoven"
-                    elif query_name == "sample06":
-                        true_song = "Vangelis - Spiral (Audio)"
-                    elif query_name == "sample07":
-                        true_song = "Metallica： The Memory Remains (Official Music Video)"
-                    else:
-                        true_song = query_name
+                    true_song = _SAMPLE_TRUTH.get(query_name, query_name)
             
             correct = (true_song and true_song in result.best_match) if true_song else None
             
@@ -402,8 +583,7 @@ class MusicIdentifier:
                 'processing_time': result.processing_time
             })
         
-        with open(output_file, 'w') as f:
-            json.dump(results_data, f, indent=2)
+        _write_json(output_file, results_data)
         
         print(f"Results saved to {output_file}")
 
@@ -7,29 +7,93 @@ Implementation for music identification using various compression algorithms.
 import gzip
 import bz2
 import lzma
+import zlib
 import zstandard as zstd
+import numpy as np
 import os
-import tempfile
-import subprocess
-from typing import Dict, List, Tuple
-from pathlib import Path
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 is optional; the 'lz4' compressor is simply not offered
+    lz4 = None
+
+try:
+    from isal import isal_zlib
+except ImportError:  # isal is optional; the 'igzip' compressor is simply not offered
+    isal_zlib = None
+
+# zlib level of the 'deflate' compressor (raw DEFLATE: no gzip header, trailer or CRC32)
+DEFLATE_LEVEL = 6
+
+# ISA-L compression level (0-3) used by the 'igzip' compressor
+ISAL_LEVEL = 1
+
+# Raw LZMA2 at preset 1 (no container header) for the 'lzma_fast' compressor, which only
+# compresses the first LZMA_FAST_CAP bytes of larger inputs and scales the size up
+LZMA_FAST_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 1}]
+LZMA_FAST_CAP = 1 << 20
+
+# Size in bytes of a trained zstd dictionary, and how many signatures it is trained on
+ZSTD_DICT_SIZE = 16384
+ZSTD_DICT_SAMPLES = 32
 
 
 class NCDCalculator:
     """Calculate NCD using different compression algorithms."""
     
-    def __init__(self):
+    def __init__(self, max_workers: int = None):
+        """
+        Args:
+            max_workers: Threads used by batch_compare (defaults to the CPU count)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # One pool for the calculator's lifetime instead of new threads for every query
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
         self.compressors = {
             'gzip': self._compress_gzip,
+            'deflate': self._compress_deflate,
             'bzip2': self._compress_bzip2,
             'lzma': self._compress_lzma,
+            'lzma_fast': self._compress_lzma_fast,
             'zstd': self._compress_zstd
         }
+        # C(xy) without building x + y: the pair is streamed through an incremental
+        # compressor, which gives exactly the size of compressing the concatenation.
+        # zstd, lz4 and igzip have no entry: their streamed output is blocked differently
+        # from a one-shot compress, so they compress x + y instead.
+        self.pair_compressors = {
+            'gzip': self._compress_gzip_pair,
+            'deflate': self._compress_deflate_pair,
+            'bzip2': self._compress_bzip2_pair,
+            'lzma': self._compress_lzma_pair
+        }
+        if lz4 is not None:
+            self.compressors['lz4'] = self._compress_lz4
+        if isal_zlib is not None:
+            self.compressors['igzip'] = self._compress_igzip
+        # Contents and compressed size of each database signature, keyed by file path
+        # and by (file path, compressor); both outlive a single query
+        self._data_cache: Dict[str, bytes] = {}
+        self._size_cache: Dict[Tuple[str, str], int] = {}
+        # Memory-mapped signature pack the cached signatures are views into, if one is loaded
+        self._pack: Optional[mmap.mmap] = None
+        # Optional trained zstd dictionary and one reusable ZstdCompressor per thread
+        # (a compressor object must not be shared between threads)
+        self._zstd_dict: Optional[zstd.ZstdCompressionDict] = None
+        self._zstd_local = threading.local()
     
     def _compress_gzip(self, data: bytes) -> int:
         """Compress data using gzip and return compressed size."""
         return len(gzip.compress(data))
     
+    def _compress_deflate(self, data: bytes) -> int:
+        """Compress data as a raw DEFLATE stream and return compressed size."""
+        return len(zlib.compress(data, DEFLATE_LEVEL, wbits=-15))
+    
     def _compress_bzip2(self, data: bytes) -> int:
         """Compress data using bzip2 and return compressed size."""
         return len(bz2.compress(data))
@@ -38,10 +102,191 @@ class NCDCalculator:
         """Compress data using lzma and return compressed size."""
         return len(lzma.compress(data))
     
+    def _compress_lzma_fast(self, data: bytes) -> int:
+        """
+        Estimate the lzma compressed size cheaply: raw LZMA2 at preset 1, and for inputs
+        over LZMA_FAST_CAP only the first LZMA_FAST_CAP bytes, scaled to the full length.
+        """
+        if len(data) <= LZMA_FAST_CAP:
+            return len(lzma.compress(data, format=lzma.FORMAT_RAW, filters=LZMA_FAST_FILTERS))
+        sample = memoryview(data)[:LZMA_FAST_CAP]
+        size = len(lzma.compress(sample, format=lzma.FORMAT_RAW, filters=LZMA_FAST_FILTERS))
+        return round(size * len(data) / LZMA_FAST_CAP)
+    
+    def _zstd_compressor(self) -> zstd.ZstdCompressor:
+        """This thread's ZstdCompressor, created on first use."""
+        cctx = getattr(self._zstd_local, 'cctx', None)
+        if cctx is None:
+            cctx = zstd.ZstdCompressor(level=3, dict_data=self._zstd_dict)
+            self._zstd_local.cctx = cctx
+        return cctx
+    
     def _compress_zstd(self, data: bytes) -> int:
         """Compress data using zstandard and return compressed size."""
-        cctx = zstd.ZstdCompressor()
-        return len(cctx.compress(data))
+        return len(self._zstd_compressor().compress(data))
+    
+    def _compress_lz4(self, data: bytes) -> int:
+        """Compress data using LZ4 (fast mode) and return compressed size."""
+        return len(lz4.frame.compress(data, compression_level=0))
+    
+    def _compress_igzip(self, data: bytes) -> int:
+        """Compress data to gzip format with Intel ISA-L and return compressed size."""
+        return len(isal_zlib.compress(data, ISAL_LEVEL, wbits=31))
+    
+    @staticmethod
+    def _stream_size(compressobj, x_data: bytes, y_data: bytes) -> int:
+        """Feed x then y to an incremental compressor and return the total output size."""
+        return len(compressobj.compress(x_data)) + len(compressobj.compress(y_data)) + len(compressobj.flush())
+    
+    def _compress_gzip_pair(self, x_data: bytes, y_data: bytes) -> int:
+        """Compressed size of x followed by y with gzip (same settings as gzip.compress)."""
+        return self._stream_size(zlib.compressobj(9, zlib.DEFLATED, 31), x_data, y_data)
+    
+    def _compress_deflate_pair(self, x_data: bytes, y_data: bytes) -> int:
+        """Compressed size of x followed by y as raw DEFLATE."""
+        return self._stream_size(zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15), x_data, y_data)
+    
+    def _compress_bzip2_pair(self, x_data: bytes, y_data: bytes) -> int:
+        """Compressed size of x followed by y with bzip2."""
+        return self._stream_size(bz2.BZ2Compressor(), x_data, y_data)
+    
+    def _compress_lzma_pair(self, x_data: bytes, y_data: bytes) -> int:
+        """Compressed size of x followed by y with lzma."""
+        return self._stream_size(lzma.LZMACompressor(), x_data, y_data)
+    
+    def _pair_func(self, compressor: str):
+        """The function computing C(xy) for a compressor, resolved once and then called directly."""
+        pair_func = self.pair_compressors.get(compressor)
+        if pair_func is None:
+            compress_func = self.compressors[compressor]
+            pair_func = lambda x_data, y_data: compress_func(x_data + y_data)
+        return pair_func
+    
+    def compress_pair(self, x_data: bytes, y_data: bytes, compressor: str) -> int:
+        """Return C(xy), streaming the two buffers when the compressor allows it."""
+        return self._pair_func(compressor)(x_data, y_data)
+    
+    def train_zstd_dictionary(self, filepaths: List[str]) -> Optional[bytes]:
+        """
+        Train a zstd dictionary on (the first ZSTD_DICT_SAMPLES) signature files;
+        returns its bytes, or None if training fails.
+        """
+        samples = [bytes(self.signature_data(filepath)) for filepath in filepaths[:ZSTD_DICT_SAMPLES]]
+        try:
+            return zstd.train_dictionary(ZSTD_DICT_SIZE, samples).as_bytes()
+        except zstd.ZstdError as e:
+            print(f"Could not train zstd dictionary: {e}")
+            return None
+    
+    def set_zstd_dictionary(self, dict_bytes: Optional[bytes]):
+        """
+        Use a trained dictionary for every zstd compression (None goes back to plain zstd).
+        C(x), C(y) and C(xy) must all share the same dictionary, so cached zstd sizes are dropped.
+        """
+        self._zstd_dict = zstd.ZstdCompressionDict(dict_bytes) if dict_bytes else None
+        self._zstd_local = threading.local()
+        for key in [key for key in self._size_cache if key[1] == 'zstd']:
+            del self._size_cache[key]
+    
+    def clear_cache(self):
+        """Forget cached signatures and compressed sizes (call after signature files are regenerated)."""
+        self._data_cache.clear()
+        self._size_cache.clear()
+        self._pack = None
+    
+    def signature_data(self, filepath: str) -> bytes:
+        """Return the contents of a database signature file, reading it only the first time."""
+        data = self._data_cache.get(filepath)
+        if data is None:
+            data = self.read_signature(filepath)
+            self._data_cache[filepath] = data
+        return data
+    
+    def preload_signatures(self, filepaths: List[str]):
+        """Read the given signature files into the cache now rather than on first use."""
+        list(self._pool.map(self.signature_data, filepaths))
+    
+    def pack_signatures(self, filepaths: List[str], pack_file: str) -> List[int]:
+        """
+        Write the signatures back to back into one file and return the offsets
+        (len(filepaths) + 1 of them) where each one starts and the last one ends.
+        """
+        offsets = [0]
+        # Written under a temporary name so a mapped older pack is never truncated underneath
+        tmp_file = f"{pack_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            for filepath in filepaths:
+                data = self.signature_data(filepath)
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        os.replace(tmp_file, pack_file)
+        return offsets
+    
+    def load_signature_pack(self, pack_file: str, filepaths: List[str], offsets: List[int]):
+        """Memory-map a file written by pack_signatures and serve those signatures from it without copying."""
+        if offsets[-1] == 0:
+            return  # nothing to map
+        with open(pack_file, 'rb') as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._pack)
+        for filepath, start, end in zip(filepaths, offsets, offsets[1:]):
+            self._data_cache[filepath] = view[start:end]
+    
+    def cached_size(self, filepath: str, data: bytes, compressor: str) -> int:
+        """Return C(data) for a signature file, compressing it only the first time."""
+        key = (filepath, compressor)
+        size = self._size_cache.get(key)
+        if size is None:
+            size = self.compressors[compressor](data)
+            self._size_cache[key] = size
+        return size
+    
+    def precompute_sizes(self, filepaths: List[str], compressors: List[str] = None):
+        """Fill the signature and size caches for the given files under every (or the given) compressor."""
+        if compressors is None:
+            compressors = list(self.compressors)
+        
+        def fill(filepath: str):
+            data = self.signature_data(filepath)
+            for compressor in compressors:
+                self.cached_size(filepath, data, compressor)
+        
+        list(self._pool.map(fill, filepaths))
+    
+    def export_sizes(self) -> Dict[str, Dict[str, int]]:
+        """Cached sizes as {file path: {compressor: size}}, ready to be stored as JSON."""
+        sizes: Dict[str, Dict[str, int]] = {}
+        for (filepath, compressor), size in self._size_cache.items():
+            sizes.setdefault(filepath, {})[compressor] = size
+        return sizes
+    
+    def load_sizes(self, sizes: Dict[str, Dict[str, int]]):
+        """Seed the size cache from the output of export_sizes."""
+        for filepath, by_compressor in sizes.items():
+            for compressor, size in by_compressor.items():
+                self._size_cache[(filepath, compressor)] = size
+    
+    @staticmethod
+    def ncd_from_sizes(c_x: int, c_y: int, c_xy: int) -> float:
+        """NCD from already known compressed sizes, clamped to [0, 1]."""
+        numerator = c_xy - min(c_x, c_y)
+        denominator = max(c_x, c_y)
+        
+        if denominator == 0:
+            return 0.0
+        
+        ncd = numerator / denominator
+        return max(0.0, min(1.0, ncd))  # Clamp to [0, 1]
+    
+    @staticmethod
+    def ncd_from_size_arrays(c_x: int, c_y: np.ndarray, c_xy: np.ndarray) -> np.ndarray:
+        """ncd_from_sizes for one C(x) against arrays of C(y) and C(xy), in a few vector operations."""
+        c_y = np.asarray(c_y, dtype=np.int64)
+        c_xy = np.asarray(c_xy, dtype=np.int64)
+        denominator = np.maximum(c_x, c_y)
+        ncd = np.divide(c_xy - np.minimum(c_x, c_y), denominator,
+                        out=np.zeros(len(c_y)), where=denominator != 0)
+        return np.clip(ncd, 0.0, 1.0)  # Clamp to [0, 1]
     
     def read_signature(self, filepath: str) -> bytes:
         """Read frequency signature file and return as bytes."""
@@ -72,18 +317,9 @@ class NCDCalculator:
         c_y = compress_func(y_data)
         
         # Calculate joint compressed size
-        xy_data = x_data + y_data
-        c_xy = compress_func(xy_data)
-        
-        # Calculate NCD
-        numerator = c_xy - min(c_x, c_y)
-        denominator = max(c_x, c_y)
+        c_xy = self.compress_pair(x_data, y_data, compressor)
         
-        if denominator == 0:
-            return 0.0
-        
-        ncd = numerator / denominator
-        return max(0.0, min(1.0, ncd))  # Clamp to [0, 1]
+        return self.ncd_from_sizes(c_x, c_y, c_xy)
     
     def calculate_ncd_from_files(self, file1: str, file2: str, compressor: str = 'gzip') -> float:
         """Calculate NCD between two signature files."""
@@ -99,7 +335,7 @@ class NCDCalculator:
         return results
     
     def batch_compare(self, query_file: str, database_files: List[str], 
-                     compressor: str = 'gzip') -> List[Tuple[str, float]]:
+                     compressor: str = 'gzip', top_n: int = None) -> List[Tuple[str, float]]:
         """
         Compare query against database and return sorted results.
         
@@ -107,22 +343,71 @@ class NCDCalculator:
             query_file: Path to query signature file
             database_files: List of database signature file paths
             compressor: Compression algorithm to use
+            top_n: Only the best top_n matches are needed (None compares every entry).
+                Entries whose NCD cannot beat them are skipped, using the lower bound
+                |C(x) - C(y)| / max{C(x), C(y)}, which assumes C(xy) >= max{C(x), C(y)};
+                real compressors can break that slightly, so this is opt-in.
             
         Returns:
             List of (filename, ncd_value) tuples sorted by NCD value
+            (with top_n, at least the top_n best; skipped entries are left out)
         """
+        if compressor not in self.compressors:
+            raise ValueError(f"Unsupported compressor: {compressor}")
+        
+        # Compressor functions are looked up once here, not once per database entry
+        compress_func = self.compressors[compressor]
+        pair_func = self._pair_func(compressor)
+        signature_data = self.signature_data
+        cached_size = self.cached_size
+        
+        # C(x) is the same for every comparison; the database signatures and C(y) are
+        # reused across queries, so only C(xy) has to be compressed per database entry
         query_data = self.read_signature(query_file)
-        results = []
+        c_x = compress_func(query_data)
         
-        for db_file in database_files:
-            db_data = self.read_signature(db_file)
-            ncd_value = self.calculate_ncd(query_data, db_data, compressor)
-            results.append((os.path.basename(db_file), ncd_value))
+        def compare(db_file: str) -> Tuple[int, int]:
+            db_data = signature_data(db_file)
+            return cached_size(db_file, db_data, compressor), pair_func(query_data, db_data)
         
-        # Sort by NCD value (ascending - lower is better)
-        results.sort(key=lambda x: x[1])
-        return results
-
+        if top_n is None:
+            # The compressors release the GIL while they work, so threads scale across
+            # cores without pickling signatures or splitting the size cache per process
+            sizes = np.array(list(self._pool.map(compare, database_files)), dtype=np.int64).reshape(-1, 2)
+            indices = np.arange(len(database_files))
+            ncd_values = self.ncd_from_size_arrays(c_x, sizes[:, 0], sizes[:, 1])
+        else:
+            indices, ncd_values = self._pruned_compare(c_x, database_files, compressor, compare, top_n)
+        
+        # Sort by NCD value (ascending - lower is better); stable, like list.sort
+        order = np.argsort(ncd_values, kind='stable')
+        return [(os.path.basename(database_files[i]), ncd)
+                for i, ncd in zip(indices[order].tolist(), ncd_values[order].tolist())]
+    
+    def _pruned_compare(self, c_x: int, database_files: List[str], compressor: str,
+                        compare, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compare the entries most likely to match first, one pool-sized chunk at a time,
+        and stop once no remaining entry can beat the current top_n.
+        Returns the indices of the compared entries and their NCD values.
+        """
+        c_y = np.array([self.cached_size(db_file, self.signature_data(db_file), compressor)
+                        for db_file in database_files], dtype=np.int64)
+        denominator = np.maximum(c_x, c_y)
+        bounds = np.divide(np.abs(c_y - c_x), denominator, out=np.zeros(len(c_y)), where=denominator != 0)
+        candidates = np.argsort(bounds, kind='stable')
+        
+        indices = np.empty(0, dtype=np.int64)
+        ncd_values = np.empty(0)
+        for start in range(0, len(candidates), self.max_workers):
+            chunk = candidates[start:start + self.max_workers]
+            if len(ncd_values) >= top_n and bounds[chunk[0]] >= np.partition(ncd_values, top_n - 1)[top_n - 1]:
+                break
+            sizes = np.array(list(self._pool.map(compare, [database_files[i] for i in chunk])),
+                             dtype=np.int64).reshape(-1, 2)
+            indices = np.concatenate([indices, chunk])
+            ncd_values = np.concatenate([ncd_values, self.ncd_from_size_arrays(c_x, sizes[:, 0], sizes[:, 1])])
+        return indices, ncd_values
 
 def main():
     """Example usage of NCDCalculator."""
@@ -0,0 +1,39 @@
+"""
+Tests for the NCD calculator.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ncd_calculator import NCDCalculator
+
+
+def _signature_like(seed: int, size: int) -> bytes:
+    """Random digits, spaces and newlines, like a text frequency signature."""
+    return bytes(random.Random(seed).choices(b'0123456789 \n', k=size))
+
+
+# (seed, len(x), len(y)); some sizes are ones where a streamed compressor has
+# been seen to disagree with compressing the concatenation
+PAIR_SPECS = [(0, 1, 1), (1, 1024, 3000), (2, 63380, 155672), (23, 136845, 54520), (28, 171236, 134029)]
+PAIRS = [(_signature_like(seed, x_size), _signature_like(seed + 100, y_size))
+         for seed, x_size, y_size in PAIR_SPECS]
+PAIR_IDS = [f'{x_size}+{y_size}' for _, x_size, y_size in PAIR_SPECS]
+
+
+@pytest.fixture(scope='module')
+def calculator():
+    return NCDCalculator(max_workers=1)
+
+
+@pytest.mark.parametrize('compressor', sorted(NCDCalculator(max_workers=1).compressors))
+@pytest.mark.parametrize('x_data,y_data', PAIRS, ids=PAIR_IDS)
+def test_compress_pair_matches_concatenation(calculator, compressor, x_data, y_data):
+    expected = calculator.compressors[compressor](x_data + y_data)
+    assert calculator.compress_pair(x_data, y_data, compressor) == expected